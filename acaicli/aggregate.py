@@ -0,0 +1,121 @@
+"""Streaming aggregations over metadata records for "find"."""
+import heapq
+import random
+from typing import Dict, Iterable, List
+from acaisdk.utils.exceptions import AcaiException
+
+# Values kept per group for percentiles, a uniform reservoir sample.
+# Percentiles are exact up to this many values and estimates beyond.
+RESERVOIR_SIZE = 4096
+
+
+def _number(v):
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return None
+
+
+def top_k(records: Iterable[Dict], k: int, key: str,
+          descending: bool = False) -> List[Dict]:
+    """The k records with the smallest (or largest) numeric value at key,
+    using a heap of size k. Records without a number at key are skipped.
+    """
+    rows = ((v, i, r) for i, r in enumerate(records)
+            for v in [_number(r.get(key))] if v is not None)
+    pick = heapq.nlargest if descending else heapq.nsmallest
+    return [r for _, _, r in pick(k, rows)]
+
+
+class Aggregate:
+    """One aggregate function over one key, e.g. "sum:__size__"."""
+
+    def __init__(self, spec: str):
+        self.spec = spec
+        func, _, self.key = spec.partition(':')
+        self.func = func.lower()
+        self.name = '{}({})'.format(self.func, self.key) if self.key \
+            else self.func
+        self.q = None
+        if self.func.startswith('p'):
+            try:
+                self.q = float(self.func[1:])
+            except ValueError:
+                self.q = -1
+            if not 0 <= self.q <= 100:
+                raise AcaiException('Bad percentile {}'.format(spec))
+        elif self.func not in ('count', 'sum', 'mean', 'min', 'max'):
+            raise AcaiException('Unknown aggregate {}, use count, sum, '
+                                'mean, min, max or pNN'.format(spec))
+        if self.func != 'count' and not self.key:
+            raise AcaiException('{} needs a key, e.g. {}:KEY'.format(
+                self.func, self.func))
+
+    def new_state(self):
+        return _State()
+
+    def result(self, state: '_State'):
+        if self.func == 'count':
+            return state.count
+        if state.count == 0:
+            return None
+        if self.func == 'sum':
+            return state.sum
+        if self.func == 'mean':
+            return state.sum / state.count
+        if self.func == 'min':
+            return state.min
+        if self.func == 'max':
+            return state.max
+        values = sorted(state.sample)
+        return values[round(self.q / 100 * (len(values) - 1))]
+
+
+class _State:
+    __slots__ = ('count', 'sum', 'min', 'max', 'sample')
+
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+        self.sample = []
+
+    def add(self, v: float):
+        self.count += 1
+        self.sum += v
+        self.min = v if self.min is None else min(self.min, v)
+        self.max = v if self.max is None else max(self.max, v)
+        if len(self.sample) < RESERVOIR_SIZE:
+            self.sample.append(v)
+        else:
+            i = random.randrange(self.count)
+            if i < RESERVOIR_SIZE:
+                self.sample[i] = v
+
+
+def group_by(records: Iterable[Dict], key: str,
+             specs: List[str]) -> List[Dict]:
+    """One row per distinct value at ``key`` (records without it are
+    grouped under None) with the aggregates in ``specs``. Memory is
+    constant per group.
+    """
+    aggregates = [Aggregate(s) for s in specs]
+    groups = {}
+    for r in records:
+        g = r.get(key)
+        if isinstance(g, (list, dict)):
+            g = str(g)
+        states = groups.get(g)
+        if states is None:
+            states = groups[g] = [a.new_state() for a in aggregates]
+        for a, state in zip(aggregates, states):
+            if a.func == 'count':
+                state.count += 1
+                continue
+            v = _number(r.get(a.key))
+            if v is not None:
+                state.add(v)
+    return [dict([(key, g)] + [(a.name, a.result(s))
+                               for a, s in zip(aggregates, states)])
+            for g, states in groups.items()]
@@ -1,8 +1,10 @@
 import sys
 import argparse
-from typing import Tuple, Dict
+import importlib
+from typing import Callable, Tuple, Dict, List
 from cliutils import print_err
-from commands import *
+from formatters import FORMATS
+import tracing
 
 
 def _has_level2_commands(func):
@@ -28,36 +30,113 @@ def _level1_checker(parser):
         exit(2)
 
 
+def _positive_int(value: str) -> int:
+    try:
+        n = int(value)
+    except ValueError:
+        n = 0
+    if n < 1:
+        raise argparse.ArgumentTypeError(
+            'should be a positive integer, got {}'.format(value))
+    return n
+
+
 class ArgumentLoader:
     def __init__(self):
         self.file_name = 'acai'
+        # service: (parser builder, name of the Command class in commands)
+        # Only the invoked service's parser is built, and the commands
+        # module (with the SDK behind it) is imported after parsing.
         self.services = {
-            'create': (self._create, CreateCommand),
-            'put': (self._put, UploadCommand),
-            'fileset': (self._fileset, FileSetCommand),
-            'job': (self._job, JobCommand),
-            'file': (self._file, FileCommand),
-            'ls': (self._list, ListCommand),
-            'get': (self._get, DownloadCommand)
+            'create': (self._create, 'CreateCommand'),
+            'put': (self._put, 'UploadCommand'),
+            'fileset': (self._fileset, 'FileSetCommand'),
+            'job': (self._job, 'JobCommand'),
+            'file': (self._file, 'FileCommand'),
+            'ls': (self._list, 'ListCommand'),
+            'du': (self._du, 'DuCommand'),
+            'sync': (self._sync, 'SyncCommand'),
+            'get': (self._get, 'DownloadCommand'),
+            'batch': (self._batch, 'BatchCommand'),
+            'shell': (self._shell, 'ShellCommand')
         }
-        self.sys_argv_backup = sys.argv
-        sys.argv = sys.argv[:2]
         formatter_class = lambda prog: MyFormatter(
             prog, max_help_position=50, width=100)
         self.main_parser = argparse.ArgumentParser(
             formatter_class=formatter_class)
         self.main_parser.add_argument(dest='service',
                                       choices=self.services.keys())
+        # Global options, given before the service name
+        self.main_parser.add_argument(
+            '--no-cache',
+            dest='cache_mode',
+            action='store_const',
+            const='off',
+            default='on',
+            help='do not use the local cache of listings and metadata.'
+        )
+        self.main_parser.add_argument(
+            '--output',
+            dest='output_format',
+            choices=FORMATS,
+            default='text',
+            help='output format. json, ndjson, csv and tsv print one '
+                 'record per file/file set/job for use in scripts.'
+        )
+        self.main_parser.add_argument(
+            '--refresh',
+            dest='cache_mode',
+            action='store_const',
+            const='refresh',
+            help='fetch listings and metadata from the server and '
+                 'refresh the local cache.'
+        )
+        self.main_parser.add_argument(
+            '--trace',
+            dest='trace',
+            default=None,
+            metavar='FILE',
+            help='time command phases and SDK calls, print a summary and '
+                 'write a Chrome trace (chrome://tracing) to FILE.'
+        )
+        self.main_parser.add_argument(
+            '--profile',
+            dest='profile',
+            action='store_true',
+            default=False,
+            help='run under cProfile and print the statistics at exit.'
+        )
 
-    def parse(self) -> Tuple[argparse.Namespace, Command]:
+    def parse(self, argv: List[str] = None) \
+            -> Tuple[argparse.Namespace, 'Command']:
+        """Parse sys.argv, or ``argv`` (without the program name) when
+        the loader is reused to run several commands in one process.
+        """
+        start = tracing.now_us()
+        if argv is not None:
+            sys.argv = [self.file_name] + argv
+        sys_argv_backup = sys.argv
+        # Split "acai [GLOBAL OPTIONS] SERVICE [ARGS]" at the service
+        i = 1
+        while i < len(sys.argv) and sys.argv[i] not in self.services:
+            i += 1
+        sys.argv = sys.argv[:i + 1]
         level1_args = self.main_parser.parse_args()
-        sys.argv = self.sys_argv_backup
+        if level1_args.trace or level1_args.profile:
+            tracing.start(level1_args.trace, level1_args.profile)
+        sys.argv = sys_argv_backup[:1] + sys_argv_backup[i:]
         args = self.services[level1_args.service][0]()
+        for k, v in vars(level1_args).items():
+            setattr(args, k, v)
+        tracing.record('parse', 'phase', start,
+                       tracing.now_us() - start)
         action = self.get_action(args)
         return args, action
 
-    def get_action(self, args: argparse.Namespace) -> Command:
-        return self.services[sys.argv[1]][1](args)
+    def get_action(self, args: argparse.Namespace) -> 'Command':
+        with tracing.span('import commands'):
+            commands = importlib.import_module('commands')
+        return getattr(commands, self.services[sys.argv[1]][1])(args)
 
     @_has_level2_commands
     def _create(self) -> argparse.Namespace:
@@ -167,6 +246,24 @@ class ArgumentLoader:
             default=None,
             help='Put uploaded files into a fileset.'
         )
+        upload_parser.add_argument(
+            '-j', '--jobs',
+            dest='jobs',
+            type=_positive_int,
+            default=8,
+            metavar='N',
+            help='Number of uploads to run in parallel. '
+                 'Small files are uploaded in batches.'
+        )
+        upload_parser.add_argument(
+            '-i', '--incremental',
+            dest='incremental',
+            action='store_true',
+            default=False,
+            help='Only upload files that are new or changed since the '
+                 'last upload to the same remote path. Uploads are '
+                 'recorded in ~/.cache/acai/manifest.sqlite.'
+        )
 
         args = parser.parse_args()
         if len(args.file_paths) < 2:
@@ -174,6 +271,13 @@ class ArgumentLoader:
                       'paths/directories.')
             upload_parser.print_help()
             exit(2)
+        # Piped paths are mapped one at a time, which only keeps them
+        # apart when they go into a directory
+        if '-' in args.file_paths[:-1] \
+                and not args.file_paths[-1].endswith('/'):
+            print_err('With "-", the remote path must be a directory '
+                      'ending with "/".')
+            exit(2)
         return args
 
     def _get(self) -> argparse.Namespace:
@@ -206,11 +310,70 @@ class ArgumentLoader:
             default=False,
             help='If not sure about the command behavior, '
                  'use this option to list the actions '
-                 'without actually uploading.'
+                 'without actually downloading.'
+        )
+        download_parser.add_argument(
+            '-j', '--jobs',
+            dest='jobs',
+            type=_positive_int,
+            default=8,
+            metavar='N',
+            help='Number of files to download in parallel.'
+        )
+        download_parser.add_argument(
+            '--chunk_size',
+            dest='chunk_size',
+            type=_positive_int,
+            default=16,
+            metavar='MB',
+            help='Files larger than this are downloaded as parallel '
+                 'range requests of this size.'
+        )
+        download_parser.add_argument(
+            '--force',
+            dest='force',
+            action='store_true',
+            default=False,
+            help='Overwrite existing files. Partially downloaded files '
+                 'are always resumed.'
+        )
+
+        return parser.parse_args()
+
+    def _batch(self) -> argparse.Namespace:
+        parser = argparse.ArgumentParser()
+        subparsers = parser.add_subparsers()
+
+        batch_parser = subparsers.add_parser(
+            'batch',
+            usage='acai batch [OPTIONS] [-f COMMAND_FILE]\n       '
+                  'cat COMMAND_FILE | acai batch [OPTIONS]'
+        )
+        batch_parser.add_argument(
+            '-f', '--file',
+            dest='file',
+            metavar='COMMAND_FILE',
+            default=None,
+            help='file with one acai command per line, e.g. "ls -l /data". '
+                 'Read from stdin if not given.'
+        )
+        batch_parser.add_argument(
+            '-j', '--jobs',
+            dest='jobs',
+            type=_positive_int,
+            default=1,
+            metavar='N',
+            help='Number of commands to run concurrently.'
         )
 
         return parser.parse_args()
 
+    def _shell(self) -> argparse.Namespace:
+        parser = argparse.ArgumentParser()
+        subparsers = parser.add_subparsers()
+        subparsers.add_parser('shell', usage='acai shell')
+        return parser.parse_args()
+
     @_has_level2_commands
     def _fileset(self) -> argparse.Namespace:
         parser = argparse.ArgumentParser(usage=self.file_name)
@@ -256,6 +419,61 @@ class ArgumentLoader:
             default=False,
             help='overwrite existing files.'
         )
+        get_fs_parser.add_argument(
+            '-j', '--jobs',
+            dest='jobs',
+            type=_positive_int,
+            default=8,
+            metavar='N',
+            help='number of files to download in parallel. Files are kept '
+                 'in ~/.cache/acai/blobs and only downloaded once, other '
+                 'versions and file sets sharing them are reflinked or, '
+                 'where the file system cannot, hardlinked (read-only) '
+                 'from there. A hardlinked file shares its data with the '
+                 'cache and every other copy: make it writable and edit '
+                 'it, and they all change. The cache notices and fetches '
+                 'its copy again, the other hardlinks keep the edit.'
+        )
+
+        mount_fs_parser = subparsers.add_parser('mount')
+        mount_fs_parser.add_argument(
+            '-f', '--fileset',
+            dest='fileset',
+            metavar='FILESET',
+            required=True,
+            help='name of the file set to mount.'
+        )
+        mount_fs_parser.add_argument(
+            dest='mount_point',
+            metavar='MOUNT_POINT',
+            help='empty local directory. The file set is served read-only '
+                 'there until unmounted, files are downloaded when first '
+                 'opened. Needs fusepy.'
+        )
+        mount_fs_parser.add_argument(
+            '-j', '--jobs',
+            dest='jobs',
+            type=_positive_int,
+            default=4,
+            metavar='N',
+            help='number of files to download in parallel.'
+        )
+        mount_fs_parser.add_argument(
+            '--read_ahead',
+            dest='read_ahead',
+            type=int,
+            default=4,
+            metavar='N',
+            help='when a file is opened, also fetch the next N files.'
+        )
+        mount_fs_parser.add_argument(
+            '--cache_size',
+            dest='cache_size',
+            type=_positive_int,
+            default=10,
+            metavar='GB',
+            help='evict fetched files beyond this size.'
+        )
 
         list_versions_parser = subparsers.add_parser('versions')
         list_versions_parser.add_argument(
@@ -264,11 +482,13 @@ class ArgumentLoader:
             help='list all versions of this file set'
         )
 
-        self._add_tag_and_untag_parser(subparsers, 'fileset')
-        self._add_find_parser(subparsers)
+        check_entities = self._add_tag_and_untag_parser(subparsers, 'fileset')
+        self._add_find_parser(subparsers, 'fileset')
 
         _level2_checker(parser)
-        return parser.parse_args()
+        args = parser.parse_args()
+        check_entities(args)
+        return args
 
     @_has_level2_commands
     def _job(self) -> argparse.Namespace:
@@ -276,73 +496,202 @@ class ArgumentLoader:
         parser.usage += ' job'
         subparsers = parser.add_subparsers(dest='action')
         run_job_parser = subparsers.add_parser('run')
-        run_job_parser.add_argument(
+        self._add_job_attribute_args(run_job_parser)
+
+        sweep_parser = subparsers.add_parser(
+            'sweep',
+            usage='acai job sweep [RUN OPTIONS] --grid KEY=V1,V2,... '
+                  '[--grid ...] [--configs FILE]'
+        )
+        self._add_job_attribute_args(sweep_parser)
+        sweep_parser.add_argument(
+            '--grid',
+            dest='grid',
+            action='append',
+            default=[],
+            metavar='KEY=V1,V2,...',
+            help='run one job per value. Several grids are combined. '
+                 'Parameters named like a job attribute (e.g. gpu) '
+                 'replace it, all can be used as {KEY} in the other '
+                 'options, e.g. --command "python train.py --lr {lr}".'
+        )
+        sweep_parser.add_argument(
+            '--configs',
+            dest='configs',
+            default=None,
+            metavar='FILE',
+            help='JSON or YAML file with a list of parameter dicts, '
+                 'combined with the grids.'
+        )
+        sweep_parser.add_argument(
+            '--sweep',
+            dest='sweep',
+            default=None,
+            metavar='NAME',
+            help='tag all jobs with sweep=NAME, a timestamp by default. '
+                 'Every job is also tagged with its parameters.'
+        )
+        sweep_parser.add_argument(
+            '--parallel',
+            dest='parallel',
+            type=_positive_int,
+            default=8,
+            metavar='N',
+            help='number of jobs to submit concurrently.'
+        )
+
+        self._add_wait_parser(subparsers, 'wait')
+        self._add_wait_parser(subparsers, 'watch')
+        check_entities = self._add_tag_and_untag_parser(subparsers, 'job')
+        self._add_find_parser(subparsers, 'job')
+
+        _level2_checker(parser)
+        args = parser.parse_args()
+        check_entities(args)
+        return args
+
+    @staticmethod
+    def _add_wait_parser(subparsers, command):
+        if command == 'wait':
+            help_msg = 'wait until all jobs are done. The exit code is 0 ' \
+                       'if all of them finished successfully. A job ' \
+                       'whose status cannot be fetched 5 times in a row ' \
+                       'counts as failed (UNREACHABLE).'
+        else:
+            help_msg = 'like wait, showing a live status board.'
+        wait_parser = subparsers.add_parser(command, help=help_msg)
+        wait_parser.add_argument(
+            nargs='*',
+            dest='job_ids',
+            type=int,
+            metavar='JOB_ID',
+            help='jobs to wait for.'
+        )
+        wait_parser.add_argument(
+            '--sweep',
+            dest='sweep',
+            default=None,
+            metavar='NAME',
+            help='also wait for all jobs of this "job sweep".'
+        )
+        wait_parser.add_argument(
+            '-q', '--query',
+            dest='query',
+            default=None,
+            metavar='EXPR',
+            help='also wait for all jobs matching this "job find" query.'
+        )
+        wait_parser.add_argument(
+            '--stdin',
+            dest='stdin',
+            action='store_true',
+            default=False,
+            help='also read job ids from stdin, one per line, or records '
+                 'with an "id" or "_id" field as printed by '
+                 '"acai --output ndjson job find".'
+        )
+        wait_parser.add_argument(
+            '--parallel',
+            dest='parallel',
+            type=_positive_int,
+            default=16,
+            metavar='N',
+            help='maximum number of concurrent status requests. Each job '
+                 'is polled less often the longer its status stays the '
+                 'same.'
+        )
+        wait_parser.add_argument(
+            '--timeout',
+            dest='timeout',
+            type=float,
+            default=None,
+            metavar='SECONDS',
+            help='stop waiting after this long.'
+        )
+        wait_parser.add_argument(
+            '--collect',
+            dest='collect',
+            default=None,
+            metavar='LOCAL_DIR',
+            help='download the output_path of every job that finishes '
+                 'successfully to LOCAL_DIR/JOB_ID/, while still waiting '
+                 'for the others.'
+        )
+        wait_parser.add_argument(
+            '-j', '--jobs',
+            dest='jobs',
+            type=_positive_int,
+            default=8,
+            metavar='N',
+            help='number of files to download in parallel per job.'
+        )
+
+    @staticmethod
+    def _add_job_attribute_args(parser):
+        parser.add_argument(
             '-n',
             dest='name',
             default=None,
             help=''
         )
-        run_job_parser.add_argument(
+        parser.add_argument(
             '-m', '--desc',
             dest='description',
             default=None,
             help=''
         )
-        run_job_parser.add_argument(
+        parser.add_argument(
             '-i', '--input_fileset',
             dest='input_fileset',
             required=True,
             help=''
         )
-        run_job_parser.add_argument(
+        parser.add_argument(
             '-o', '--output_path',
             dest='output_path',
             required=True,
             help=''
         )
-        run_job_parser.add_argument(
+        parser.add_argument(
             '--code',
             dest='code',
             required=True,
-            help=''
+            help='remote path of the code archive, or a local directory. '
+                 'A directory is archived (without files matched by '
+                 '.acaiignore) and only uploaded if the same code was '
+                 'not uploaded before.'
         )
-        run_job_parser.add_argument(
+        parser.add_argument(
             '--command',
             dest='command',
             required=True,
             help=''
         )
-        run_job_parser.add_argument(
+        parser.add_argument(
             '--image',
             dest='image',
             required=True,
             help=''
         )
-        run_job_parser.add_argument(
+        parser.add_argument(
             '--gpu',
             dest='gpu',
             default='0',
             help=''
         )
-        run_job_parser.add_argument(
+        parser.add_argument(
             '--vcpu',
             dest='vcpu',
             default='0.5',
             help=''
         )
-        run_job_parser.add_argument(
+        parser.add_argument(
             '--mem',
             dest='mem',
             default='512Mi',
             help=''
         )
 
-        self._add_tag_and_untag_parser(subparsers, 'job')
-        self._add_find_parser(subparsers)
-
-        _level2_checker(parser)
-        return parser.parse_args()
-
     @_has_level2_commands
     def _file(self) -> argparse.Namespace:
         parser = argparse.ArgumentParser(usage=self.file_name)
@@ -366,11 +715,13 @@ class ArgumentLoader:
             help='list all versions of this file.'
         )
 
-        self._add_tag_and_untag_parser(subparsers, 'file')
-        self._add_find_parser(subparsers)
+        check_entities = self._add_tag_and_untag_parser(subparsers, 'file')
+        self._add_find_parser(subparsers, 'file')
 
         _level2_checker(parser)
-        return parser.parse_args()
+        args = parser.parse_args()
+        check_entities(args)
+        return args
 
     def _list(self) -> argparse.Namespace:
         parser = argparse.ArgumentParser()
@@ -390,10 +741,142 @@ class ArgumentLoader:
             default=False,
             help='If print meta data.'
         )
+        list_parser.add_argument(
+            '-U', '--unsorted',
+            action='store_true',
+            dest='unsorted',
+            default=False,
+            help='Print entries in the order they are received, '
+                 'without sorting. Fastest for huge directories.'
+        )
+        list_parser.add_argument(
+            '-R',
+            action='store_true',
+            dest='recursive',
+            default=False,
+            help='List subdirectories recursively.'
+        )
+        list_parser.add_argument(
+            '--max_depth',
+            dest='max_depth',
+            type=int,
+            default=None,
+            metavar='N',
+            help='With -R, descend at most N levels below the directory.'
+        )
+        list_parser.add_argument(
+            '--max_concurrency',
+            dest='max_concurrency',
+            type=_positive_int,
+            default=8,
+            metavar='N',
+            help='With -R, list up to N directories at once.'
+        )
+
+        return parser.parse_args()
+
+    def _du(self) -> argparse.Namespace:
+        parser = argparse.ArgumentParser()
+        subparsers = parser.add_subparsers()
+
+        du_parser = subparsers.add_parser('du')
+        du_parser.add_argument(
+            nargs='?',
+            dest='directory',
+            metavar='DIRECTORY',
+            help='remote directory, the root directory if not given.'
+        )
+        du_parser.add_argument(
+            '-d', '--depth',
+            dest='print_depth',
+            type=int,
+            default=None,
+            metavar='N',
+            help='only print totals of directories at most N levels '
+                 'below DIRECTORY. Everything is still counted.'
+        )
+        du_parser.add_argument(
+            '--max_depth',
+            dest='max_depth',
+            type=int,
+            default=None,
+            metavar='N',
+            help='do not descend more than N levels below DIRECTORY.'
+        )
+        du_parser.add_argument(
+            '--max_concurrency',
+            dest='max_concurrency',
+            type=_positive_int,
+            default=8,
+            metavar='N',
+            help='number of concurrent listing and metadata requests.'
+        )
+        du_parser.add_argument(
+            '-b', '--bytes',
+            dest='bytes',
+            action='store_true',
+            default=False,
+            help='print sizes in bytes.'
+        )
 
         return parser.parse_args()
 
-    def _add_tag_and_untag_parser(self, subparsers, command):
+    def _sync(self) -> argparse.Namespace:
+        parser = argparse.ArgumentParser()
+        subparsers = parser.add_subparsers()
+
+        sync_parser = subparsers.add_parser(
+            'sync',
+            usage='acai sync [OPTIONS] LOCAL_DIR/ REMOTE_DIR/'
+        )
+        sync_parser.add_argument(
+            dest='local_dir',
+            metavar='LOCAL_DIR',
+            help='local directory.'
+        )
+        sync_parser.add_argument(
+            dest='remote_dir',
+            metavar='REMOTE_DIR',
+            help='remote directory.'
+        )
+        sync_parser.add_argument(
+            '-d', '--dry_run',
+            dest='dry_run',
+            action='store_true',
+            default=False,
+            help='list the transfers without doing them.'
+        )
+        sync_parser.add_argument(
+            '--delete',
+            dest='delete',
+            action='store_true',
+            default=False,
+            help='delete local files that were deleted remotely since '
+                 'the last sync, instead of downloading them again.'
+        )
+        sync_parser.add_argument(
+            '--prefer',
+            dest='prefer',
+            choices=['local', 'remote'],
+            default=None,
+            help='resolve conflicts by keeping this side. Conflicts are '
+                 'reported and left alone otherwise.'
+        )
+        sync_parser.add_argument(
+            '-j', '--jobs',
+            dest='jobs',
+            type=_positive_int,
+            default=8,
+            metavar='N',
+            help='number of concurrent listings and transfers.'
+        )
+
+        return parser.parse_args()
+
+    def _add_tag_and_untag_parser(self, subparsers, command) \
+            -> Callable[[argparse.Namespace], None]:
+        """:return: a check of the parsed arguments, tag and untag need
+            entities given as arguments, by --glob or on stdin"""
         entity_name_map = {
             'job': ('-j', '--job_id', 'JOB_ID', 'job', int),
             'file': ('-f', '--file', 'FILE', 'file', str),
@@ -407,10 +890,11 @@ class ArgumentLoader:
             opt, long_opt,
             dest='entity',
             metavar=metavar,
-            required=True,
+            nargs='+',
             type=id_type,
-            help='id of the {} to add metadata to.'.format(name)
+            help='ids of the {}s to add metadata to.'.format(name)
         )
+        self._add_bulk_entity_args(tag_parser, command, name)
         tag_parser.add_argument(
             '-t', '--tags',
             dest='tags',
@@ -440,10 +924,11 @@ class ArgumentLoader:
             opt, long_opt,
             dest='entity',
             metavar=metavar,
-            required=True,
+            nargs='+',
             type=id_type,
-            help='id of the {} to remove metadata from.'.format(name)
+            help='ids of the {}s to remove metadata from.'.format(name)
         )
+        self._add_bulk_entity_args(untag_parser, command, name)
         untag_parser.add_argument(
             '-t', '--tags',
             dest='tags',
@@ -461,7 +946,49 @@ class ArgumentLoader:
                  'E.g. untag -k eval_loss'
         )
 
-    def _add_find_parser(self, subparsers):
+        parsers = {'tag': tag_parser, 'untag': untag_parser}
+        selectors = ['{}/{}'.format(opt, long_opt), '--stdin']
+        if command == 'file':
+            selectors.insert(1, '-g/--glob')
+
+        def check(args):
+            if args.action in parsers and not (
+                    args.entity or getattr(args, 'glob', None)
+                    or args.stdin):
+                parsers[args.action].error(
+                    'one of the arguments {} is required'.format(
+                        ' '.join(selectors)))
+        return check
+
+    @staticmethod
+    def _add_bulk_entity_args(parser, command, name):
+        """More ways to select entities for tag and untag."""
+        if command == 'file':
+            parser.add_argument(
+                '-g', '--glob',
+                dest='glob',
+                metavar='PATTERN',
+                nargs='+',
+                help='select files in a remote directory by a glob '
+                     'pattern, e.g. "/output/*.ckpt".'
+            )
+        parser.add_argument(
+            '--stdin',
+            dest='stdin',
+            action='store_true',
+            default=False,
+            help='read {} ids from stdin, one per line.'.format(name)
+        )
+        parser.add_argument(
+            '--parallel',
+            dest='parallel',
+            type=_positive_int,
+            default=8,
+            metavar='N',
+            help='number of metadata updates to send concurrently.'
+        )
+
+    def _add_find_parser(self, subparsers, command):
         """This method creates a parser for "find" function for file, fileset
         and job command.
         """
@@ -518,6 +1045,105 @@ class ArgumentLoader:
                  'a number range. Left exclusive, right inclusive.\n'
                  'E.g. --range  loss=0.5-1.0  __size__=1024-65535'
         )
+        find_parser.add_argument(
+            '-q', '--query',
+            dest='query',
+            metavar='EXPR',
+            help='find entity matching a query expression with AND, OR, '
+                 'NOT, comparisons, "in", regex ("~") and exists(). '
+                 'E.g. -q \'eval_loss < 0.3 and optimizer in (adam, sgd)\''
+        )
+        find_parser.add_argument(
+            '--explain',
+            dest='explain',
+            action='store_true',
+            default=False,
+            help='print how --query is split between the server and '
+                 'local filtering, without running it.'
+        )
+        find_parser.add_argument(
+            '--limit',
+            dest='limit',
+            type=_positive_int,
+            default=None,
+            metavar='N',
+            help='print at most N results.'
+        )
+        find_parser.add_argument(
+            '--page_size',
+            dest='page_size',
+            type=_positive_int,
+            default=1000,
+            metavar='N',
+            help='results are processed and printed N at a time.'
+        )
+        find_parser.add_argument(
+            '--fields',
+            dest='fields',
+            metavar='KEY',
+            nargs='+',
+            help='only print these metadata keys (and the id) '
+                 'of each result.'
+        )
+        find_parser.add_argument(
+            '--top',
+            dest='top',
+            type=_positive_int,
+            metavar='K',
+            help='print the K entities with the smallest value at '
+                 '--by KEY (largest with --descending).'
+        )
+        find_parser.add_argument(
+            '--by',
+            dest='by',
+            metavar='KEY',
+            help='key to rank by for --top. With --group_by, an aggregate '
+                 'column such as "mean(eval_loss)".'
+        )
+        find_parser.add_argument(
+            '--descending',
+            dest='descending',
+            action='store_true',
+            default=False,
+            help='rank --top by largest value first.'
+        )
+        find_parser.add_argument(
+            '--group_by',
+            dest='group_by',
+            metavar='KEY',
+            help='print one row per distinct value at KEY with the '
+                 '--agg aggregates (default: count).'
+        )
+        find_parser.add_argument(
+            '--agg',
+            dest='agg',
+            metavar='FUNC:KEY',
+            nargs='+',
+            help='aggregates for --group_by: count, sum:KEY, mean:KEY, '
+                 'min:KEY, max:KEY or a percentile like p90:KEY. '
+                 'E.g. --group_by __creator_id__ --agg count sum:__size__'
+        )
+        if command == 'job':
+            find_parser.add_argument(
+                '--output_files',
+                dest='output_files',
+                metavar='KEY',
+                nargs='?',
+                const='output_path',
+                default=None,
+                help='instead of the jobs, print the files in their '
+                     'output location (metadata KEY, default output_path; '
+                     'a remote directory or "@FILESET") with file metadata '
+                     'and the job id.'
+            )
+            find_parser.add_argument(
+                '--parallel',
+                dest='parallel',
+                type=_positive_int,
+                default=8,
+                metavar='N',
+                help='number of concurrent lookups for --output_files.'
+            )
 
 
 class MyFormatter(argparse.HelpFormatter):
@@ -0,0 +1,251 @@
+import os
+import time
+import shutil
+import hashlib
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+from cliutils import CACHE_DIR
+from manifest import hash_file
+from transfer import Downloader, DEFAULT_JOBS
+
+DEFAULT_ROOT = os.path.join(CACHE_DIR, 'blobs')
+# Blobs no materialized file links to any more are evicted beyond this.
+DEFAULT_MAX_BYTES = 20 * 1024 * 1024 * 1024
+# Linux ioctl to share the extents of one file with another (reflink)
+_FICLONE = 0x40049409
+
+
+def _reflink(src: str, dst: str) -> bool:
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    with open(src, 'rb') as s, open(dst, 'wb') as d:
+        try:
+            fcntl.ioctl(d.fileno(), _FICLONE, s.fileno())
+            return True
+        except OSError:
+            pass
+    os.remove(dst)
+    return False
+
+
+class BlobStore:
+    """Local content-addressed store of remote file versions.
+
+    A versioned remote path ("/a/b.txt:3") never changes content, so it is
+    used as the key. Each key maps to the sha256 of its content and the
+    blob is stored once under ``objects/`` by that hash, no matter how many
+    paths or versions share it. Files are materialized from the store as
+    reflinks where the file system supports them, otherwise as hardlinks
+    and as copies as the last resort.
+
+    Blobs are read-only, but a hardlinked file can still be changed in
+    place after a chmod, which changes the blob too. The store keeps the
+    mtime of every blob and hashes it again when that moved; a blob whose
+    content no longer matches its hash is dropped and downloaded again.
+    """
+
+    def __init__(self, root: str = DEFAULT_ROOT,
+                 max_bytes: int = DEFAULT_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.tmp_dir = os.path.join(root, 'tmp')
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(os.path.join(root, 'blobs.sqlite'),
+                                    check_same_thread=False,
+                                    isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS blobs ('
+                          'key TEXT PRIMARY KEY, sha256 TEXT, '
+                          'size INTEGER, accessed REAL, mtime_ns INTEGER)')
+        columns = [r[1] for r in self.conn.execute(
+            'PRAGMA table_info(blobs)')]
+        if 'mtime_ns' not in columns:
+            # Stores created before mtimes were kept: verified on use
+            self.conn.execute('ALTER TABLE blobs ADD COLUMN mtime_ns INTEGER')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS blobs_sha256 '
+                          'ON blobs (sha256)')
+
+    def blob_path(self, sha256: str) -> str:
+        return os.path.join(self.root, 'objects', sha256[:2], sha256[2:])
+
+    def lookup(self, key: str) -> Optional[str]:
+        """Path of the blob of ``key`` if it is in the store and intact."""
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT sha256, size, mtime_ns FROM blobs WHERE key = ?',
+                (key,)).fetchone()
+            if row is None:
+                return None
+            sha256, size, mtime_ns = row
+            if not self._intact(sha256, size, mtime_ns):
+                return None
+            self.conn.execute('UPDATE blobs SET accessed = ? WHERE key = ?',
+                              (time.time(), key))
+            return self.blob_path(sha256)
+
+    def _intact(self, sha256: str, size: int, mtime_ns: int) -> bool:
+        """Whether the blob still has its content, hashing it only when
+        its mtime moved. A changed or missing blob is forgotten."""
+        path = self.blob_path(sha256)
+        try:
+            st = os.stat(path)
+            if st.st_size == size and st.st_mtime_ns == mtime_ns:
+                return True
+            if st.st_size == size and hash_file(path) == sha256:
+                self.conn.execute(
+                    'UPDATE blobs SET mtime_ns = ? WHERE sha256 = ?',
+                    (st.st_mtime_ns, sha256))
+                return True
+            # Written to through a hardlink
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        self.conn.execute('DELETE FROM blobs WHERE sha256 = ?', (sha256,))
+        return False
+
+    def add(self, key: str, path: str) -> str:
+        """Move a downloaded file into the store.
+
+        :return: path of the blob
+        """
+        sha256 = hash_file(path)
+        blob = self.blob_path(sha256)
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT size, mtime_ns FROM blobs WHERE sha256 = ?',
+                (sha256,)).fetchone()
+            known = row is not None and self._intact(sha256, *row)
+        if known:
+            # Same content under another key
+            os.remove(path)
+        else:
+            os.chmod(path, 0o444)
+            os.replace(path, blob)
+        st = os.stat(blob)
+        with self.lock:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?, ?)',
+                (key, sha256, st.st_size, time.time(), st.st_mtime_ns))
+        return blob
+
+    def fetch(self, keys: Iterable[str], jobs: int = DEFAULT_JOBS,
+              downloader: Downloader = None) \
+            -> Dict[str, Tuple[Optional[str], Optional[Exception]]]:
+        """Blobs of all keys, downloading the ones not in the store.
+
+        :return: {key: (blob path, None) or (None, error)}
+        """
+        found, missing = {}, []
+        for key in dict.fromkeys(keys):
+            blob = self.lookup(key)
+            if blob:
+                found[key] = (blob, None)
+            else:
+                missing.append(key)
+
+        downloader = downloader or Downloader(jobs=jobs)
+        # Downloads are named by key so an interrupted fetch resumes
+        results = downloader.download([(k, self._tmp_path(k))
+                                       for k in missing])
+        for key, tmp, error in results:
+            if error:
+                found[key] = (None, error)
+            else:
+                found[key] = (self.add(key, tmp), None)
+        return found
+
+    def _tmp_path(self, key):
+        return os.path.join(self.tmp_dir,
+                            hashlib.sha256(key.encode()).hexdigest())
+
+    @staticmethod
+    def materialize(blob: str, dest: str) -> str:
+        """Make ``dest`` a file with the content of ``blob``.
+
+        :return: "reflink", "hardlink" or "copy"
+        """
+        dest_dir = os.path.dirname(dest)
+        if dest_dir:
+            os.makedirs(dest_dir, exist_ok=True)
+        if _reflink(blob, dest):
+            return 'reflink'
+        try:
+            os.link(blob, dest)
+            return 'hardlink'
+        except OSError:
+            shutil.copyfile(blob, dest)
+            return 'copy'
+
+    def prune(self, max_bytes: int = None, keep: Iterable[str] = ()) -> int:
+        """Evict least recently used blobs until the store is below
+        ``max_bytes``. Blobs still hardlinked from somewhere and blobs of
+        the keys in ``keep`` are kept.
+
+        :return: bytes freed
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        with self.lock:
+            kept = {row[0] for key in keep for row in self.conn.execute(
+                'SELECT sha256 FROM blobs WHERE key = ?', (key,))}
+            rows = self.conn.execute(
+                'SELECT sha256, MAX(size), MAX(accessed) FROM blobs '
+                'GROUP BY sha256 ORDER BY MAX(accessed)').fetchall()
+            total = sum(size for _, size, _ in rows)
+            freed = 0
+            for sha256, size, _ in rows:
+                if total <= max_bytes:
+                    break
+                if sha256 in kept:
+                    continue
+                path = self.blob_path(sha256)
+                try:
+                    if os.stat(path).st_nlink > 1:
+                        continue
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                self.conn.execute('DELETE FROM blobs WHERE sha256 = ?',
+                                  (sha256,))
+                total -= size
+                freed += size
+        return freed
+
+    def close(self):
+        self.conn.close()
+
+
+def materialize_all(store: BlobStore, r_l_mapping: List[Tuple[str, str]],
+                    jobs: int = DEFAULT_JOBS, force: bool = False) \
+        -> Tuple[Dict[str, int], List[Tuple[str, Exception]]]:
+    """Materialize (versioned remote path, local path) pairs through the
+    store, downloading only the blobs it does not have yet.
+
+    :return: ({"reflink"/"hardlink"/"copy"/"existing"/"fetched": count},
+              [(remote path, error)])
+    """
+    counts, failed = {}, []
+    todo = []
+    for r, l in r_l_mapping:
+        if os.path.lexists(l):
+            if not force:
+                counts['existing'] = counts.get('existing', 0) + 1
+                continue
+            os.remove(l)
+        todo.append((r, l))
+
+    missing = {r for r, _ in todo if store.lookup(r) is None}
+    blobs = store.fetch((r for r, _ in todo), jobs)
+    counts['fetched'] = sum(1 for r in missing if blobs[r][0])
+    for r, l in todo:
+        blob, error = blobs[r]
+        if error:
+            failed.append((r, error))
+            continue
+        how = store.materialize(blob, l)
+        counts[how] = counts.get(how, 0) + 1
+    return counts, failed
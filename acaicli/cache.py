@@ -0,0 +1,221 @@
+import os
+import json
+import time
+import contextvars
+import threading
+from typing import Any, Callable, Dict, List, Optional
+from cliutils import CACHE_DIR, LazyImport
+
+File = LazyImport('acaisdk.file', 'File')
+FileSet = LazyImport('acaisdk.fileset', 'FileSet')
+Meta = LazyImport('acaisdk.meta', 'Meta')
+
+DEFAULT_PATH = os.path.join(CACHE_DIR, 'cache.sqlite')
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+# Larger listings are not cached: storing and reading them back costs
+# about as much as listing again, and they would evict everything else.
+MAX_LISTING_ENTRIES = 10000
+
+# Seconds an entry stays valid. Versioned file metadata only changes
+# through tagging, which this CLI invalidates itself.
+LIST_DIR_TTL = 60
+FILE_SET_TTL = 60
+FILE_META_TTL = 600
+
+# Modes, set with the global --no-cache / --refresh options
+ON = 'on'
+OFF = 'off'  # neither read nor write the cache
+REFRESH = 'refresh'  # do not read, but store fresh results
+
+# Per context rather than per process, so that commands running side by
+# side in "acai batch -j" each keep their own mode
+_mode = contextvars.ContextVar('cache_mode', default=ON)
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def configure(mode: str) -> None:
+    _mode.set(mode)
+
+
+def get_cache() -> Optional['Cache']:
+    """The process wide cache, or None when caching is off."""
+    if _mode.get() == OFF:
+        return None
+    return _open()
+
+
+def _open() -> 'Cache':
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = Cache()
+        return _cache
+
+
+def _cache_to_invalidate() -> Optional['Cache']:
+    """The cache whatever the mode: entries a command made stale go
+    even with --no-cache. None if there is no cache yet."""
+    if _cache is None and not os.path.exists(DEFAULT_PATH):
+        return None
+    return _open()
+
+
+class Cache:
+    """Key-value store in SQLite with per-entry TTLs.
+
+    Values are JSON. When the total size exceeds ``max_bytes``, the least
+    recently used entries are evicted. Values taking more than
+    ``max_bytes / 16`` are not stored.
+    """
+
+    def __init__(self, path: str = DEFAULT_PATH,
+                 max_bytes: int = DEFAULT_MAX_BYTES):
+        # Imported here to keep it off the startup path of every command
+        import sqlite3
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.max_bytes = max_bytes
+        self.max_value_bytes = max_bytes // 16
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False,
+                                    isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS cache ('
+                          'key TEXT PRIMARY KEY, value TEXT, '
+                          'expires REAL, accessed REAL, size INTEGER)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS cache_accessed '
+                          'ON cache (accessed)')
+
+    def get_many(self, keys: List[str]) -> Dict[str, Any]:
+        """Values of the keys that are cached and not expired."""
+        if _mode.get() == REFRESH or not keys:
+            return {}
+        now = time.time()
+        found = {}
+        with self.lock:
+            # Stay below SQLite's limit of bound parameters
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                marks = ','.join('?' * len(chunk))
+                rows = self.conn.execute(
+                    'SELECT key, value FROM cache WHERE key IN ({}) '
+                    'AND expires > ?'.format(marks), chunk + [now])
+                found.update((k, json.loads(v)) for k, v in rows)
+            if found:
+                self.conn.executemany(
+                    'UPDATE cache SET accessed = ? WHERE key = ?',
+                    [(now, k) for k in found])
+        return found
+
+    def get(self, key: str) -> Any:
+        return self.get_many([key]).get(key)
+
+    def put_many(self, items: Dict[str, Any], ttl: float) -> None:
+        now = time.time()
+        rows = []
+        for k, v in items.items():
+            value = json.dumps(v)
+            if len(value) <= self.max_value_bytes:
+                rows.append((k, value, now + ttl, now, len(value)))
+        with self.lock:
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?)', rows)
+            self._evict()
+
+    def put(self, key: str, value: Any, ttl: float) -> None:
+        self.put_many({key: value}, ttl)
+
+    def invalidate(self, prefix: str) -> None:
+        """Drop every entry whose key starts with ``prefix``."""
+        with self.lock:
+            self.conn.execute(
+                "DELETE FROM cache WHERE substr(key, 1, ?) = ?",
+                (len(prefix), prefix))
+
+    def _evict(self):
+        total = self.conn.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM cache').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        self.conn.execute('DELETE FROM cache WHERE expires <= ?',
+                          (time.time(),))
+        # Evict down to 90% so we do not evict on every insert
+        target = self.max_bytes * 0.9
+        rows = self.conn.execute(
+            'SELECT key, size FROM cache ORDER BY accessed').fetchall()
+        total = sum(size for _, size in rows)
+        doomed = []
+        for key, size in rows:
+            if total <= target:
+                break
+            doomed.append((key,))
+            total -= size
+        self.conn.executemany('DELETE FROM cache WHERE key = ?', doomed)
+
+
+def _cached(key: str, ttl: float, fetch: Callable[[], Any],
+            entries: Callable[[Any], int] = len) -> Any:
+    """:param entries: number of entries of a value, values with more
+        than ``MAX_LISTING_ENTRIES`` are not stored"""
+    cache = get_cache()
+    if cache is None:
+        return fetch()
+    value = cache.get(key)
+    if value is None:
+        value = fetch()
+        if entries(value) <= MAX_LISTING_ENTRIES:
+            cache.put(key, value, ttl)
+    return value
+
+
+def list_dir(directory: str) -> List[Dict]:
+    """Cached :meth:`File.list_dir`, unless the directory is large."""
+    return _cached('list_dir:' + directory, LIST_DIR_TTL,
+                   lambda: File.list_dir(directory))
+
+
+def list_file_set_content(file_set: str) -> Dict:
+    """Cached :meth:`FileSet.list_file_set_content`, unless the file set
+    is large."""
+    return _cached('fileset:' + file_set, FILE_SET_TTL,
+                   lambda: FileSet.list_file_set_content(file_set),
+                   entries=lambda content: len(content.get('files', ())))
+
+
+def get_file_meta(*paths: str) -> Dict:
+    """Cached :meth:`Meta.get_file_meta`. Only the paths missing from the
+    cache are requested from the backend.
+    """
+    cache = get_cache()
+    if cache is None:
+        return Meta.get_file_meta(*paths)
+    found = cache.get_many(['file_meta:' + p for p in paths])
+    missing = [p for p in paths if 'file_meta:' + p not in found]
+    data = list(found.values())
+    if missing:
+        fetched = Meta.get_file_meta(*missing)['data']
+        cache.put_many({'file_meta:' + d['_id']: d for d in fetched},
+                       FILE_META_TTL)
+        data += fetched
+    return {'data': data}
+
+
+def invalidate_files() -> None:
+    """After uploads: directory listings are stale. Metadata of existing
+    file versions is not affected."""
+    cache = _cache_to_invalidate()
+    if cache:
+        cache.invalidate('list_dir:')
+
+
+def invalidate_file_meta(path: str) -> None:
+    """After (un)tagging a file, given with or without a version."""
+    cache = _cache_to_invalidate()
+    if cache:
+        cache.invalidate('file_meta:' + path)
+
+
+def invalidate_file_set(file_set: str) -> None:
+    cache = _cache_to_invalidate()
+    if cache:
+        cache.invalidate('fileset:' + file_set.split(':')[0])
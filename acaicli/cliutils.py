@@ -1,4 +1,11 @@
+import os
 import sys
+import contextvars
+import importlib
+
+# Local state of the CLI: caches, indexes, manifests
+CACHE_DIR = os.path.join(
+    os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')), 'acai')
 
 
 class Colors:
@@ -12,16 +19,32 @@ class Colors:
     UNDERLINE = '\033[4m'
 
 
-def print_info(*msg):
-    print(color_msg(*msg, color=Colors.GREEN))
+# Where the print_* helpers write when no stream is given: stdout, or
+# stderr while stdout holds machine-readable output (--output). Per
+# context, like the output format it follows.
+_message_stream = contextvars.ContextVar('message_stream', default=None)
+
+
+def set_message_stream(stream) -> None:
+    """:param stream: a file, or None for the current sys.stdout"""
+    _message_stream.set(stream)
+
+
+def _print(msg: str, color: str, stream=None):
+    stream = stream or _message_stream.get() or sys.stdout
+    print(color_msg(*msg, color=color, stream=stream), file=stream)
+
+
+def print_info(*msg, stream=None):
+    _print(msg, Colors.GREEN, stream)
 
 
-def print_warn(*msg):
-    print(color_msg(*msg, color=Colors.YELLOW))
+def print_warn(*msg, stream=None):
+    _print(msg, Colors.YELLOW, stream)
 
 
-def print_err(*msg):
-    print(color_msg(*msg, color=Colors.RED))
+def print_err(*msg, stream=None):
+    _print(msg, Colors.RED, stream)
 
 
 def print_err_and_exit(*msg):
@@ -29,8 +52,32 @@ def print_err_and_exit(*msg):
     exit(2)
 
 
-def color_msg(*msg, color=None):
-    if sys.stdout.isatty() and color:
+def color_msg(*msg, color=None, stream=None):
+    if (stream or sys.stdout).isatty() and color:
         return color + ' '.join(msg) + Colors.ENDC
     else:
         return ' '.join(msg)
+
+
+class LazyImport:
+    """Stand-in for ``from module import name`` that defers the import
+    until the object is first used, keeping "acai" startup cheap for
+    commands that never touch it.
+    """
+
+    def __init__(self, module: str, name: str):
+        self._module = module
+        self._name = name
+        self._obj = None
+
+    def _load(self):
+        if self._obj is None:
+            module = importlib.import_module(self._module)
+            self._obj = getattr(module, self._name)
+        return self._obj
+
+    def __getattr__(self, item):
+        return getattr(self._load(), item)
+
+    def __call__(self, *args, **kwargs):
+        return self._load()(*args, **kwargs)
@@ -0,0 +1,113 @@
+"""Deterministic code archives for "job run --code LOCAL_DIR".
+
+The archive of a directory only depends on the relative paths, contents
+and executable bits of its files: entries are sorted and get a fixed
+timestamp. Its sha256 is recorded as metadata of the uploaded archive, so
+submitting unchanged code again costs one metadata lookup instead of an
+upload.
+"""
+import os
+import stat
+import fnmatch
+import hashlib
+import zipfile
+import tempfile
+from typing import List, Tuple
+from cliutils import LazyImport
+from manifest import hash_file
+
+File = LazyImport('acaisdk.file', 'File')
+Meta = LazyImport('acaisdk.meta', 'Meta')
+Condition = LazyImport('acaisdk.meta', 'Condition')
+
+IGNORE_FILE = '.acaiignore'
+DEFAULT_IGNORE = ['.git', '.hg', '.svn', '__pycache__', '*.pyc',
+                  '.DS_Store', '.ipynb_checkpoints', IGNORE_FILE]
+REMOTE_DIR = '/.acai/code/'
+HASH_KEY = 'code_sha256'
+# Zip cannot store dates before 1980
+_EPOCH = (1980, 1, 1, 0, 0, 0)
+
+
+def _ignore_patterns(root: str) -> List[str]:
+    """Defaults plus one glob per line of ``.acaiignore``, as matched
+    against both names and paths relative to the root."""
+    patterns = list(DEFAULT_IGNORE)
+    path = os.path.join(root, IGNORE_FILE)
+    if os.path.isfile(path):
+        with open(path) as f:
+            patterns += [l.strip().rstrip('/') for l in f
+                         if l.strip() and not l.startswith('#')]
+    return patterns
+
+
+def _ignored(rel: str, patterns: List[str]) -> bool:
+    name = os.path.basename(rel)
+    return any(fnmatch.fnmatch(name, p) or fnmatch.fnmatch(rel, p)
+               for p in patterns)
+
+
+def list_files(root: str) -> List[Tuple[str, str]]:
+    """Sorted (relative path, full path) of the files to archive."""
+    patterns = _ignore_patterns(root)
+    files = []
+    for dir_path, dir_names, names in os.walk(root):
+        rel_dir = os.path.relpath(dir_path, root).replace(os.sep, '/')
+        rel_dir = '' if rel_dir == '.' else rel_dir + '/'
+        dir_names[:] = [d for d in dir_names
+                        if not _ignored(rel_dir + d, patterns)]
+        files += [(rel_dir + n, os.path.join(dir_path, n)) for n in names
+                  if not _ignored(rel_dir + n, patterns)]
+    return sorted(files)
+
+
+def _is_executable(path: str) -> bool:
+    return bool(os.stat(path).st_mode & stat.S_IXUSR)
+
+
+def code_hash(files: List[Tuple[str, str]]) -> str:
+    """Hash of what goes into the archive, without building it."""
+    h = hashlib.sha256()
+    for rel, full in files:
+        h.update('{}\0{}\0{}\0'.format(rel, int(_is_executable(full)),
+                                        hash_file(full)).encode())
+    return h.hexdigest()
+
+
+def build_archive(files: List[Tuple[str, str]], out_path: str) -> None:
+    with zipfile.ZipFile(out_path, 'w', zipfile.ZIP_DEFLATED) as z:
+        for rel, full in files:
+            info = zipfile.ZipInfo(rel, date_time=_EPOCH)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            mode = 0o755 if _is_executable(full) else 0o644
+            info.external_attr = (stat.S_IFREG | mode) << 16
+            with open(full, 'rb') as src, z.open(info, 'w') as dst:
+                while True:
+                    buf = src.read(1024 * 1024)
+                    if not buf:
+                        break
+                    dst.write(buf)
+
+
+def upload_code(root: str) -> Tuple[str, bool]:
+    """Remote path of the archive of ``root``, uploading it only if no
+    archive with the same content was uploaded before.
+
+    :return: (remote path, whether it was uploaded)
+    """
+    files = list_files(root)
+    digest = code_hash(files)
+    found = Meta.find_file(Condition(HASH_KEY).value(digest))['data']
+    if found:
+        return found[0]['_id'], False
+
+    remote_path = '{}{}.zip'.format(REMOTE_DIR, digest)
+    fd, tmp = tempfile.mkstemp(suffix='.zip')
+    os.close(fd)
+    try:
+        build_archive(files, tmp)
+        File.upload([(tmp, remote_path)])
+    finally:
+        os.remove(tmp)
+    Meta.update_file_meta(remote_path, [], {HASH_KEY: digest})
+    return remote_path, True
@@ -0,0 +1,75 @@
+import os
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+from cliutils import LazyImport
+from transfer import Downloader, strip_version, DEFAULT_JOBS
+from walk import walk_files
+import cache
+
+Meta = LazyImport('acaisdk.meta', 'Meta')
+
+# Jobs whose outputs are downloaded at the same time, each with its own
+# pool of download workers.
+CONCURRENT_JOBS = 2
+
+
+class OutputCollector:
+    """Downloads the outputs of jobs in the background as they finish.
+
+    Each job's ``output_path`` (a remote directory, or a file set as
+    "@NAME") ends up in ``out_dir/<job id>/``, while other jobs are
+    still being waited on.
+    """
+
+    def __init__(self, out_dir: str, jobs: int = DEFAULT_JOBS,
+                 key: str = 'output_path'):
+        self.out_dir = out_dir
+        self.jobs = jobs
+        self.key = key
+        self.pool = ThreadPoolExecutor(CONCURRENT_JOBS)
+        self.futures = {}
+        self.lock = threading.Lock()
+
+    def submit(self, job_id) -> None:
+        with self.lock:
+            if job_id not in self.futures:
+                self.futures[job_id] = self.pool.submit(
+                    contextvars.copy_context().run, self._collect, job_id)
+
+    def _collect(self, job_id) -> List[Tuple[str, str, Exception]]:
+        job = Meta.get_job_meta(job_id)['data'][0]
+        location = job.get(self.key)
+        if not location:
+            return []
+        local_dir = os.path.join(self.out_dir, str(job_id))
+        r_l_mapping = [(r, os.path.join(local_dir, rel))
+                       for r, rel in self._files(str(location))]
+        return Downloader(jobs=self.jobs).download(r_l_mapping)
+
+    @staticmethod
+    def _files(location: str):
+        """(versioned remote path, relative local path) of an output"""
+        if location.startswith('@'):
+            for f in cache.list_file_set_content(location[1:])['files']:
+                yield f, strip_version(f).lstrip('/')
+        else:
+            yield from walk_files(location if location.endswith('/')
+                                  else location + '/')
+
+    def finish(self) -> Dict[object, Tuple[int, List]]:
+        """Wait for all downloads.
+
+        :return: {job id: (files downloaded, [(remote path, error)])}
+        """
+        self.pool.shutdown(wait=True)
+        results = {}
+        for job_id, future in self.futures.items():
+            try:
+                downloads = future.result()
+                failed = [(r, e) for r, _, e in downloads if e]
+                results[job_id] = (len(downloads) - len(failed), failed)
+            except Exception as e:
+                results[job_id] = (0, [(None, e)])
+        return results
@@ -1,20 +1,81 @@
 from acaisdk.utils.exceptions import *
+from acaisdk.utils.utils import debug, bytes_to_size
 from cliutils import *
-from acaisdk.file import File
-from acaisdk.fileset import FileSet
-from acaisdk.project import Project
-from acaisdk.utils.utils import debug
-from acaisdk.job import Job
-from acaisdk.meta import Meta, Condition
-from prettyprint import PrettyPrint
+from prettyprint import PrettyPrint, Alignment
+import cache
+import metaquery
+import query
+import aggregate
+import tracing
+
+# SDK and transfer modules are only imported by the commands using them.
+File = LazyImport('acaisdk.file', 'File')
+FileSet = LazyImport('acaisdk.fileset', 'FileSet')
+Project = LazyImport('acaisdk.project', 'Project')
+Job = LazyImport('acaisdk.job', 'Job')
+Meta = LazyImport('acaisdk.meta', 'Meta')
+Condition = LazyImport('acaisdk.meta', 'Condition')
+Downloader = LazyImport('transfer', 'Downloader')
+Uploader = LazyImport('transfer', 'Uploader')
+Manifest = LazyImport('manifest', 'Manifest')
+strip_version = LazyImport('transfer', 'strip_version')
+iter_file_meta = LazyImport('metafetch', 'iter_file_meta')
+walk_files = LazyImport('walk', 'walk_files')
+walk_tree = LazyImport('walk', 'walk_tree')
+job_output_files = LazyImport('joins', 'job_output_files')
+Sync = LazyImport('sync', 'Sync')
+BlobStore = LazyImport('blobstore', 'BlobStore')
+materialize_all = LazyImport('blobstore', 'materialize_all')
+LazyFileSet = LazyImport('lazyfs', 'LazyFileSet')
+mount_lazy = LazyImport('lazyfs', 'mount')
+JobWatcher = LazyImport('jobwatch', 'JobWatcher')
+StatusBoard = LazyImport('jobwatch', 'StatusBoard')
+upload_code = LazyImport('codebundle', 'upload_code')
+OutputCollector = LazyImport('collect', 'OutputCollector')
 import os
-from typing import List
+import json
+import time
+import queue
+import itertools
+import threading
+import functools
+import contextvars
+import shlex
+import fnmatch
+from typing import List, Tuple
 from enum import Enum, auto
 
 
+def _with_options(process):
+    @functools.wraps(process)
+    def wrapper(self, *args, **kwargs):
+        cache.configure(self.cache_mode)
+        PrettyPrint.configure(self.output_format)
+        return process(self, *args, **kwargs)
+    return wrapper
+
+
+def _stdin_job_id(value) -> int:
+    """A job id read with --stdin, anything else is a usage error."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        print_err_and_exit('Job ids should be integers, got "{}" on '
+                           'stdin'.format(value))
+
+
 class Command:
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if 'process' in vars(cls):
+            cls.process = _with_options(tracing.traced(
+                cls.__name__ + '.process')(cls.process))
+
     def __init__(self, args):
         self.args = args
+        # Global options, applied to the context process() runs in
+        self.cache_mode = getattr(args, 'cache_mode', cache.ON)
+        self.output_format = getattr(args, 'output_format', 'text')
 
     def process(self):
         pass
@@ -23,38 +84,167 @@ class Command:
 class UploadCommand(Command):
     def process(self):
         paths = self.args.file_paths
+        local_paths, remote_path = paths[:-1], paths[-1]
         # Allow additional input from pipe in
-        if '-' in paths[:-1]:
-            paths.remove('-')
-            more_inputs = [l.strip() for l in sys.stdin if l.strip()]
-            paths = more_inputs + paths
+        if '-' in local_paths:
+            local_paths = [p for p in local_paths if p != '-']
+            ignored_paths = []
+            l_r_mapping = UploadCommand.stream_file_mapping(
+                sys.stdin, local_paths, remote_path, ignored_paths)
+        else:
+            l_r_mapping, ignored_paths = \
+                File.convert_to_file_mapping(local_paths, remote_path)
 
-        l_r_mapping, ignored_paths = \
-            File.convert_to_file_mapping(paths[:-1], paths[-1])
+        manifest = Manifest() if self.args.incremental else None
+        skipped = []
+        if manifest:
+            l_r_mapping = UploadCommand._skip_unchanged(
+                manifest, l_r_mapping, skipped)
 
         if self.args.dry_run:
             print_info('[DRY RUN] Files to be uploaded:')
             for l, r in l_r_mapping:
                 print('{} => {}'.format(l, r))
+            if skipped:
+                print_info('[DRY RUN] Files to be skipped (unchanged):')
+                for l, r in skipped:
+                    print('{} => {}'.format(l, r))
             if ignored_paths:
                 print_warn('[DRY RUN] Files to be ignored (inaccessible):')
                 for l in ignored_paths:
                     print(l)
         else:
-            result = File.upload(l_r_mapping)
-            if self.args.fileset:
+            uploader = Uploader(jobs=self.args.jobs)
+            result = uploader.upload(l_r_mapping)
+            result.skipped = skipped
+            cache.invalidate_files()
+            if manifest:
+                manifest.record(result.uploaded)
+                manifest.close()
+            for l, r, e in result.failed:
+                print_err('Failed to upload {}: {}'.format(l, e))
+            print_info('Uploaded {} files ({}) in {:.1f}s, {}/s'.format(
+                len(result.uploaded),
+                bytes_to_size(result.bytes_uploaded),
+                result.elapsed,
+                bytes_to_size(int(result.throughput))))
+            if skipped:
+                print_info('Skipped {} unchanged files'.format(len(skipped)))
+            if self.args.fileset and (result.uploaded or skipped):
                 r = result.as_new_file_set(self.args.fileset)
+                cache.invalidate_file_set(self.args.fileset)
                 print(r)
-            print("results:")
-            print(result)
+            if result.failed:
+                exit(1)
+
+
+    @staticmethod
+    def _skip_unchanged(manifest, l_r_mapping, skipped: List):
+        for l, r, is_changed in manifest.classify(l_r_mapping):
+            if is_changed:
+                yield l, r
+            else:
+                skipped.append((l, r))
+
+    @staticmethod
+    def stream_file_mapping(lines, local_paths: List[str], remote_path: str,
+                            ignored_paths: List[str], queue_size=1024):
+        """Map paths read from ``lines`` (e.g. stdin) as they arrive.
+
+        Reading and mapping happen on a background thread feeding a bounded
+        queue, so the uploader can start on the first paths while the
+        producer on the other side of the pipe is still running.
+        """
+        q = queue.Queue(maxsize=queue_size)
+        done = object()
+
+        def produce():
+            try:
+                for l in itertools.chain(lines, local_paths):
+                    l = l.strip()
+                    if not l:
+                        continue
+                    mapping, ignored = \
+                        File.convert_to_file_mapping([l], remote_path)
+                    for pair in mapping:
+                        q.put(pair)
+                    ignored_paths.extend(ignored)
+                q.put(done)
+            except Exception as e:
+                q.put(e)
+
+        threading.Thread(target=produce, daemon=True).start()
+        while True:
+            item = q.get()
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
 
 
 class DownloadCommand(Command):
     def process(self):
-        # If
-        # self.args.paths
-        # TODO: I was here
-        pass
+        r_l_mapping = DownloadCommand.convert_to_file_mapping(self.args.paths)
+
+        if self.args.dry_run:
+            print_info('[DRY RUN] Files to be downloaded:')
+            for r, l in r_l_mapping:
+                print('{} => {}'.format(r, l))
+            return
+
+        downloader = Downloader(jobs=self.args.jobs,
+                                chunk_size=self.args.chunk_size * 1024 * 1024,
+                                force=self.args.force)
+        results = downloader.download(r_l_mapping)
+        failed = [(r, e) for r, _, e in results if e]
+        for r, e in failed:
+            print_err('Failed to download {}: {}'.format(r, e))
+        print_info('{} of {} files downloaded'.format(
+            len(results) - len(failed), len(results)))
+        if failed:
+            exit(1)
+
+    @staticmethod
+    def convert_to_file_mapping(paths: List[str]) -> List[Tuple[str, str]]:
+        """Turn the positional arguments of "acai get" into
+        (remote path, local path) pairs.
+        """
+        if len(paths) == 1:
+            if paths[0].startswith('@') or paths[0].endswith('/'):
+                print_err_and_exit('Must provide a local directory.')
+            return [(paths[0], os.path.basename(strip_version(paths[0])))]
+
+        remote_paths, local_path = paths[:-1], paths[-1]
+
+        if remote_paths[0].startswith('@'):
+            # @FILESET LOCAL_DIR/
+            if len(remote_paths) > 1:
+                print_err_and_exit('Only one file set can be downloaded '
+                                   'at a time.')
+            r = FileSet.list_file_set_content(remote_paths[0][1:])
+            return [(f, os.path.join(local_path,
+                                     strip_version(f).lstrip('/')))
+                    for f in r['files']]
+
+        if len(remote_paths) == 1 and remote_paths[0].endswith('/'):
+            # REMOTE_DIR/ LOCAL_DIR/
+            return [(r, os.path.join(local_path, rel))
+                    for r, rel in walk_files(remote_paths[0])]
+
+        if len(remote_paths) == 1 and not local_path.endswith('/') \
+                and not os.path.isdir(local_path):
+            # REMOTE_FILE LOCAL_FILE
+            return [(remote_paths[0], local_path)]
+
+        # REMOTE_FILE_1 REMOTE_FILE_2 ... LOCAL_DIR/
+        for r in remote_paths:
+            if r.endswith('/') or r.startswith('@'):
+                print_err_and_exit('Only files can be downloaded together, '
+                                   'got {}'.format(r))
+        return [(r, os.path.join(local_path,
+                                 os.path.basename(strip_version(r))))
+                for r in remote_paths]
 
 
 class CreateCommand(Command):
@@ -76,27 +266,20 @@ class CreateCommand(Command):
         elif self.args.create == 'fileset':
             r = FileSet.create_file_set(self.args.fileset,
                                         self.args.remote_paths)
+            cache.invalidate_file_set(self.args.fileset)
             print(r)
 
 
 class JobCommand(Command):
     def process(self):
         if self.args.action == 'run':
-            attrs = {
-                'name': self.args.name,
-                'v_cpu': self.args.vcpu,
-                'memory': self.args.mem,
-                'gpu': self.args.gpu,
-                'command': self.args.command,
-                'container_image': self.args.image,
-                'input_file_set': self.args.input_fileset,
-                'output_path': self.args.output_path,
-                'code': self.args.code,
-                'description': self.args.description,
-            }
-            j = Job().with_attributes(attrs).register()
+            j = Job().with_attributes(self._attributes()).register()
             PrettyPrint.job(j)
             j.run()
+        elif self.args.action == 'sweep':
+            self.submit_sweep()
+        elif self.args.action in ('wait', 'watch'):
+            self.wait()
         elif self.args.action == 'tag':
             MetaCommand.tag(MetaCommand.EntityType.JOB, self.args)
         elif self.args.action == 'untag':
@@ -104,28 +287,192 @@ class JobCommand(Command):
         elif self.args.action == 'find':
             MetaCommand.find(MetaCommand.EntityType.JOB, self.args)
 
+    def _job_ids(self) -> List[int]:
+        """Jobs given as arguments, by sweep, by query and on stdin."""
+        ids = list(self.args.job_ids)
+        pages = []
+        if self.args.sweep:
+            pages.append(metaquery.find_pages(
+                Meta.find_job, [Condition('sweep').value(self.args.sweep)]))
+        if self.args.query:
+            pages.append(query.plan(query.parse(self.args.query))
+                         .execute(Meta.find_job, []))
+        for page in itertools.chain.from_iterable(pages):
+            ids += [int(r['_id']) for r in page]
+        if self.args.stdin:
+            for line in sys.stdin:
+                line = line.strip()
+                if line.startswith('{'):
+                    r = json.loads(line)
+                    ids.append(_stdin_job_id(r.get('id', r.get('_id'))))
+                elif line:
+                    ids.append(_stdin_job_id(line))
+        if not ids:
+            raise AcaiException('No jobs given')
+        return list(dict.fromkeys(ids))
+
+    def wait(self):
+        collector = None
+        if self.args.collect:
+            collector = OutputCollector(self.args.collect, self.args.jobs)
+        watcher = self._watch(collector.submit if collector else None)
+        failed = watcher.failed()
+
+        if collector:
+            if PrettyPrint.is_text():
+                print_info('Waiting for outputs to download')
+            for job_id, (n, errors) in collector.finish().items():
+                for r, e in errors:
+                    print_err('Failed to collect {} of job {}: {}'.format(
+                        r or 'output', job_id, e))
+                    failed.append(job_id)
+                if PrettyPrint.is_text():
+                    print('{}  {} files -> {}'.format(
+                        job_id, n, os.path.join(self.args.collect,
+                                                str(job_id))))
+
+        if not PrettyPrint.is_text():
+            def records():
+                for j, s in watcher.status.items():
+                    r = {'id': j, 'status': s}
+                    if j in watcher.errors:
+                        r['error'] = str(watcher.errors[j])
+                    yield r
+            PrettyPrint.records(records())
+        else:
+            for j in watcher.failed():
+                if watcher.status[j] == JobWatcher.UNREACHABLE:
+                    print_err('{}  {}: {}'.format(j, watcher.status[j],
+                                                  watcher.errors[j]))
+                elif watcher.status[j] in JobWatcher.TERMINAL:
+                    print_err('{}  {}'.format(j, watcher.status[j]))
+                elif j in watcher.errors:
+                    print_err('{}  {}, last polling error: {}'.format(
+                        j, watcher.status[j], watcher.errors[j]))
+            counts = ', '.join('{} {}'.format(n, s) for s, n
+                               in sorted(watcher.counts().items()))
+            print_info('{} jobs: {}'.format(len(watcher.status), counts))
+        if failed:
+            exit(1)
+
+    def _watch(self, on_finished=None) -> 'JobWatcher':
+        """Poll all jobs until they are done.
+
+        :param on_finished: called with the job id as soon as a job
+            finishes successfully
+        """
+        watcher = JobWatcher(self._job_ids(), self.args.parallel)
+        board = None
+        if self.args.action == 'watch' and PrettyPrint.is_text() \
+                and sys.stdout.isatty():
+            board = StatusBoard(sys.stdout)
+        deadline = time.monotonic() + self.args.timeout \
+            if self.args.timeout is not None else None
+        while not watcher.done():
+            timeout = None
+            if deadline is not None:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    print_warn('Timed out')
+                    break
+            changes = watcher.poll(timeout)
+            if board:
+                board.draw(watcher, changes)
+            elif self.args.action == 'watch' and PrettyPrint.is_text():
+                for job_id, old, new in changes:
+                    print('{}  {} -> {}'.format(job_id, old, new))
+            if on_finished:
+                for job_id, _, new in changes:
+                    if new == JobWatcher.SUCCEEDED:
+                        on_finished(job_id)
+        return watcher
+
+    def _attributes(self) -> dict:
+        return {
+            'name': self.args.name,
+            'v_cpu': self.args.vcpu,
+            'memory': self.args.mem,
+            'gpu': self.args.gpu,
+            'command': self.args.command,
+            'container_image': self.args.image,
+            'input_file_set': self.args.input_fileset,
+            'output_path': self.args.output_path,
+            'code': self._code(),
+            'description': self.args.description,
+        }
+
+    def _code(self) -> str:
+        """--code as given, or for a local directory, the remote path of
+        its archive, uploaded if not done before."""
+        if not os.path.isdir(self.args.code):
+            return self.args.code
+        remote_path, uploaded = upload_code(self.args.code)
+        if uploaded:
+            print_info('Uploaded code to {}'.format(remote_path))
+        else:
+            print_info('Code unchanged, using {}'.format(remote_path))
+        return remote_path
+
+    def submit_sweep(self):
+        import sweep
+        grid = sweep.expand_grid(self.args.grid)
+        configs = sweep.load_configs(self.args.configs) \
+            if self.args.configs else []
+        if not grid and not configs:
+            raise AcaiException('Give at least one --grid or --configs')
+        points = sweep.combine(grid, configs)
+        name = self.args.sweep or time.strftime('sweep-%Y%m%d-%H%M%S')
+        results = sweep.submit(self._attributes(), points, {'sweep': name},
+                               self.args.parallel)
+
+        keys = list(dict.fromkeys(k for p, _ in points for k in p))
+        if not PrettyPrint.is_text():
+            PrettyPrint.records(
+                dict(p, id=j.id if j else None,
+                     error=str(e) if e else None)
+                for p, j, e in results)
+        else:
+            rows = [['id'] + keys]
+            for (_, text), (_, j, _) in zip(points, results):
+                rows.append([str(j.id) if j else '-']
+                            + [text.get(k, '') for k in keys])
+            PrettyPrint.aligned_print(
+                rows, [Alignment.RIGHT] + [Alignment.LEFT] * len(keys))
+        failed = [(p, e) for p, _, e in results if e]
+        for p, e in failed:
+            print_err('Failed to submit {}: {}'.format(p, e))
+        print_info('Sweep {}: {} of {} jobs submitted'.format(
+            name, len(results) - len(failed), len(results)))
+        if failed:
+            exit(1)
+
 
 class FileSetCommand(Command):
     def process(self):
         if self.args.action == 'ls':
             if not self.args.fileset:
                 r = FileSet.list_file_sets()
-                PrettyPrint.single_col(r, lexi_sort=True)
+                PrettyPrint.single_col(r, lexi_sort=True, field='fileset')
             else:
-                r = FileSet.list_file_set_content(self.args.fileset)
+                r = cache.list_file_set_content(self.args.fileset)
                 with_meta = self.args.with_meta
-                fs_msg = '[FILESET] {}'.format(r['id'])
-                print(fs_msg)
+                if PrettyPrint.is_text():
+                    fs_msg = '[FILESET] {}'.format(r['id'])
+                    print(fs_msg)
                 ListCommand.list_file_set_content(r['id'], with_meta)
         elif self.args.action == 'get':
-            # Download a fileset to a folder
-            FileSet.download_file_set(self.args.fileset,
-                                      self.args.output,
-                                      self.args.force)
+            self.download()
+        elif self.args.action == 'mount':
+            lazy = LazyFileSet(self.args.fileset, jobs=self.args.jobs,
+                               read_ahead=self.args.read_ahead,
+                               cache_bytes=self.args.cache_size * 1024 ** 3)
+            try:
+                mount_lazy(lazy, self.args.mount_point)
+            finally:
+                lazy.close()
         elif self.args.action == 'versions':
             r = FileSet.list_file_set_versions(self.args.fileset)
-            for d in r:
-                print(d['id'])
+            PrettyPrint.single_col((d['id'] for d in r), field='id')
         elif self.args.action == 'tag':
             MetaCommand.tag(MetaCommand.EntityType.FILESET, self.args)
         elif self.args.action == 'untag':
@@ -133,22 +480,45 @@ class FileSetCommand(Command):
         elif self.args.action == 'find':
             MetaCommand.find(MetaCommand.EntityType.FILESET, self.args)
 
+    def download(self):
+        """Materialize a file set through the local blob store, so files
+        shared with versions or file sets fetched before are not downloaded
+        again."""
+        r = FileSet.list_file_set_content(self.args.fileset)
+        r_l_mapping = [(f, os.path.join(self.args.output,
+                                        strip_version(f).lstrip('/')))
+                       for f in r['files']]
+        store = BlobStore()
+        try:
+            counts, failed = materialize_all(store, r_l_mapping,
+                                             self.args.jobs, self.args.force)
+            store.prune()
+        finally:
+            store.close()
+        for r, e in failed:
+            print_err('Failed to download {}: {}'.format(r, e))
+        materialized = sum(counts.get(k, 0)
+                           for k in ('reflink', 'hardlink', 'copy'))
+        print_info('{} files: {} downloaded, {} reused from the local '
+                   'store, {} already present'.format(
+                       len(r_l_mapping), counts['fetched'],
+                       materialized - counts['fetched'],
+                       counts.get('existing', 0)))
+        if failed:
+            exit(1)
+
 
 class FileCommand(Command):
     def process(self):
         if self.args.action == 'ls':
             if not self.args.directory:
                 self.args.directory = '/'
-            r = File.list_dir(self.args.directory)
-            for d in r:
-                path = d['path']
-                if d['is_dir']:
-                    path += '/'
-                print(path)
+            r = cache.list_dir(self.args.directory)
+            PrettyPrint.single_col(d['path'] + '/' if d['is_dir']
+                                   else d['path'] for d in r)
         elif self.args.action == 'versions':
             r = File.list_file_versions(self.args.file)
-            for path in r:
-                print(path)
+            PrettyPrint.single_col(r)
         elif self.args.action == 'tag':
             MetaCommand.tag(MetaCommand.EntityType.FILE, self.args)
         elif self.args.action == 'untag':
@@ -180,20 +550,20 @@ class MetaCommand(Command):
             constraints.append(Condition(args.min).min())
         if args.value:
             for kv in args.value:
-                k, v = kv.split('=')
+                k, v = kv.split('=', 1)
                 constraints.append(Condition(k).value(v))
         if args.number_value:
             for kv in args.number_value:
-                k, v = kv.split('=')
+                k, v = kv.split('=', 1)
                 v = float(v)
                 constraints.append(Condition(k).value(v))
         if args.regex_value:
             for kv in args.regex_value:
-                k, v = kv.split('=')
+                k, v = kv.split('=', 1)
                 constraints.append(Condition(k).value(v).re())
         if args.range:
             for k_range in args.range:
-                k, r = k_range.split('=')
+                k, r = k_range.split('=', 1)
                 left, right = map(float, r.split('-'))
                 constraints.append(Condition(k).range(left, right))
 
@@ -202,8 +572,35 @@ class MetaCommand(Command):
             MetaCommand.EntityType.FILE: Meta.find_file,
             MetaCommand.EntityType.FILESET: Meta.find_file_set
         }
-        r = find_methods[entity_type](*constraints)
-        PrettyPrint.print(r['data'])
+        if args.query:
+            plan = query.plan(query.parse(args.query))
+            if args.explain:
+                print(plan)
+                return
+            pages = plan.execute(find_methods[entity_type], constraints,
+                                 args.page_size)
+        else:
+            pages = metaquery.find_pages(find_methods[entity_type],
+                                         constraints, args.page_size)
+        if entity_type == MetaCommand.EntityType.JOB and args.output_files:
+            # Join: output files of the matching jobs
+            jobs = metaquery.records(pages, args.limit)
+            files = job_output_files(jobs, args.output_files, args.parallel)
+            fields = args.fields + ['job_id'] if args.fields else None
+            PrettyPrint.stream(metaquery.records([files], fields=fields))
+            return
+        results = metaquery.records(pages, args.limit)
+        fields = args.fields
+        if args.group_by:
+            results = aggregate.group_by(results, args.group_by,
+                                         args.agg or ['count'])
+            fields = None
+        if args.top:
+            if not args.by:
+                raise AcaiException('--top needs --by KEY')
+            results = aggregate.top_k(results, args.top, args.by,
+                                      args.descending)
+        PrettyPrint.stream(metaquery.records([results], fields=fields))
 
     @staticmethod
     def _modify_meta(entity_type: EntityType, args):
@@ -232,9 +629,16 @@ class MetaCommand(Command):
             MetaCommand.EntityType.FILESET: Meta.update_file_set_meta
         }
 
-        r = methods[entity_type](args.entity, tags, kv_pairs)
-
-        print(r['status'])
+        entities = MetaCommand._collect_entities(entity_type, args)
+        if entity_type == MetaCommand.EntityType.FILE:
+            for e in entities:
+                cache.invalidate_file_meta(e)
+        results = MetaCommand._bulk_update(methods[entity_type], entities,
+                                           args.parallel, tags, kv_pairs)
+        if len(results) == 1 and not results[0][2]:
+            print(results[0][1]['status'])
+        else:
+            MetaCommand._print_bulk_summary(results)
 
     @staticmethod
     def _remove_meta(entity_type: EntityType, args):
@@ -248,9 +652,80 @@ class MetaCommand(Command):
             MetaCommand.EntityType.FILE: Meta.del_file_meta,
             MetaCommand.EntityType.FILESET: Meta.del_file_set_meta
         }
-        r = methods[entity_type](args.entity, tags, keys)
+        entities = MetaCommand._collect_entities(entity_type, args)
+        if entity_type == MetaCommand.EntityType.FILE:
+            for e in entities:
+                cache.invalidate_file_meta(e)
+        results = MetaCommand._bulk_update(methods[entity_type], entities,
+                                           args.parallel, tags, keys)
+        if len(results) == 1 and not results[0][2]:
+            print(results[0][1])
+        else:
+            MetaCommand._print_bulk_summary(results)
+
+    @staticmethod
+    def _collect_entities(entity_type: EntityType, args) -> List:
+        """Entities given as arguments, matched by --glob (files only) and
+        read from stdin (--stdin), in that order and without duplicates.
+        """
+        entities = list(args.entity or [])
+        if getattr(args, 'glob', None):
+            for pattern in args.glob:
+                entities += MetaCommand._glob_files(pattern)
+        if args.stdin:
+            for line in sys.stdin:
+                line = line.strip()
+                if not line:
+                    continue
+                if entity_type == MetaCommand.EntityType.JOB:
+                    line = _stdin_job_id(line)
+                entities.append(line)
+        if not entities:
+            raise AcaiException('No entity given')
+        return list(dict.fromkeys(entities))
 
-        print(r)
+    @staticmethod
+    def _glob_files(pattern: str) -> List[str]:
+        """Match a glob against the files of a single remote directory."""
+        directory, name_pattern = os.path.split(pattern)
+        return [os.path.join(directory, d['path'])
+                for d in File.list_dir(directory or '/')
+                if not d['is_dir'] and fnmatch.fnmatch(d['path'],
+                                                       name_pattern)]
+
+    @staticmethod
+    def _bulk_update(method, entities: List, parallel: int, *update_args) \
+            -> List[Tuple]:
+        """Call ``method(entity, *update_args)`` for every entity with at
+        most ``parallel`` requests in flight. The metadata API updates one
+        entity per request.
+
+        :return: list of (entity, response, error)
+        """
+        def update(entity):
+            try:
+                return entity, method(entity, *update_args), None
+            except Exception as e:
+                return entity, None, e
+
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max(1, parallel)) as pool:
+            return list(pool.map(update, entities))
+
+    @staticmethod
+    def _print_bulk_summary(results: List[Tuple]) -> None:
+        failed = 0
+        for entity, _, error in results:
+            if error:
+                failed += 1
+                print_err('FAILED {}: {}'.format(entity, error))
+            else:
+                print('OK     {}'.format(entity))
+        msg = '{} succeeded, {} failed'.format(len(results) - failed, failed)
+        if failed:
+            print_err(msg)
+            exit(1)
+        print_info(msg)
 
 
 class ListCommand(Command):
@@ -262,57 +737,307 @@ class ListCommand(Command):
             if len(file_set) == 0:
                 # If only an "@" is given, list all filesets
                 r = FileSet.list_file_sets()
-                PrettyPrint.single_col(r, lexi_sort=True)
+                PrettyPrint.single_col(r, lexi_sort=True, field='fileset')
             else:
                 ListCommand.list_file_set_content(file_set, with_meta)
+        elif self.args.recursive:
+            ListCommand.list_tree(v or '/', with_meta, self.args.unsorted,
+                                  self.args.max_depth,
+                                  self.args.max_concurrency)
         else:
             try:
-                ListCommand.list_dir(v, with_meta)
+                ListCommand.list_dir(v, with_meta, self.args.unsorted)
             except RemoteException:
                 # Folder does not exist, maybe it is a file
                 try:
-                    r = Meta.get_file_meta([v])
+                    r = cache.get_file_meta(v)
                     PrettyPrint.print(r['data'][0])
-                except RemoteException:
+                except (RemoteException, IndexError):
                     print('{} does not exist'.format(v))
 
+    @staticmethod
+    def list_tree(root, with_meta: bool, unsorted: bool = False,
+                  max_depth: int = None, parallel: int = 8):
+        """ls -R: every directory under root, listed breadth first."""
+        if not PrettyPrint.is_text():
+            # One stream, so that the output stays one document
+            PrettyPrint.records(ListCommand._tree_records(
+                root, with_meta, unsorted, max_depth, parallel))
+            return
+        for directory, entries in walk_tree(root, max_depth, parallel,
+                                            list_dir=cache.list_dir):
+            print('{}:'.format(directory))
+            ListCommand._print_files(directory,
+                                     ListCommand._explicit_paths(directory,
+                                                                 entries),
+                                     with_meta=with_meta, unsorted=unsorted)
+            print()
+
+    @staticmethod
+    def _tree_records(root, with_meta: bool, unsorted: bool,
+                      max_depth: int, parallel: int):
+        """Records of ls -R for machine-readable output, each with the
+        directory it was listed in."""
+        for directory, entries in walk_tree(root, max_depth, parallel,
+                                            list_dir=cache.list_dir):
+            paths = list(ListCommand._explicit_paths(directory, entries))
+            if with_meta:
+                failed = []
+                for r in PrettyPrint.meta_records(ListCommand._meta_batches(
+                        PrettyPrint.sort_by_type(paths), failed)):
+                    yield dict({'dir': directory}, **r)
+                for failed_paths, error in failed:
+                    print_warn('Could not fetch metadata of {} files: {}'
+                               .format(len(failed_paths), error))
+            else:
+                for p in paths if unsorted else sorted(paths):
+                    yield {'dir': directory, 'path': p}
 
     @staticmethod
-    def list_dir(dir_path, with_meta:bool):
+    def list_dir(dir_path, with_meta: bool, unsorted: bool = False):
         if not dir_path:
             # Nothing given, list root directory.
             dir_path = '/'
-        r = File.list_dir(dir_path)
-        explicit_paths = []
+        r = cache.list_dir(dir_path)
+        if dir_path == '/':
+            dir_path = ''
+        explicit_paths = ListCommand._explicit_paths(dir_path, r)
+        ListCommand._print_files(dir_path, explicit_paths,
+                                 with_meta=with_meta, unsorted=unsorted)
 
-        for d in r:
+    @staticmethod
+    def _explicit_paths(dir_path, entries):
+        """Directories as "name/", files as "dir/name:version"."""
+        for d in entries:
             if d['is_dir']:
-                path = d['path'] + '/'
-                explicit_paths.append(path)
+                yield d['path'] + '/'
             else:
                 versioned_path = ':'.join([d['path'], str(d['version'])])
-                if dir_path == '/':
-                    dir_path = ''
-                explicit_paths.append(os.path.join(dir_path, versioned_path))
-
-        ListCommand._print_files(dir_path, explicit_paths, with_meta=with_meta)
+                yield os.path.join(dir_path, versioned_path)
 
     @staticmethod
     def list_file_set_content(file_set, with_meta: bool):
-        r = FileSet.list_file_set_content(file_set)
+        r = cache.list_file_set_content(file_set)
         ListCommand._print_files(r['id'], r['files'], with_meta)
 
     @staticmethod
-    def _print_files(file_set_or_dir, file_paths, with_meta: bool) -> None:
+    def _print_files(file_set_or_dir, file_paths, with_meta: bool,
+                     unsorted: bool = False) -> None:
         if with_meta:
-            paths_without_dir = [p for p in file_paths if not p.endswith('/')]
-            meta = []
-            if paths_without_dir:
-                r = Meta.get_file_meta(*paths_without_dir)
-                meta = r['data']
-            # By default, sort by file name
-            PrettyPrint.list_with_meta(file_set_or_dir,
-                                       sorted(file_paths),
-                                       meta)
+            # By default, sort by file name, directories first
+            file_paths = PrettyPrint.sort_by_type(list(file_paths))
+            failed = []
+            PrettyPrint.list_with_meta_batches(
+                file_set_or_dir,
+                ListCommand._meta_batches(file_paths, failed),
+                path_width=max(map(len, file_paths), default=0))
+            for paths, error in failed:
+                print_warn('Could not fetch metadata of {} files: {}'.format(
+                    len(paths), error))
         else:
-            PrettyPrint.single_col(file_paths, lexi_sort=True)
+            PrettyPrint.single_col(file_paths, lexi_sort=not unsorted)
+
+
+    @staticmethod
+    def _meta_batches(file_paths: List[str], failed: List):
+        """Directories, then files in batches with their metadata, as
+        :meth:`PrettyPrint.list_with_meta_batches` expects them.
+        """
+        yield [p for p in file_paths if p.endswith('/')], []
+        files = [p for p in file_paths if not p.endswith('/')]
+        for paths, metas, error in iter_file_meta(files):
+            if error:
+                failed.append((paths, error))
+            yield paths, metas
+
+
+class DuCommand(Command):
+    def process(self):
+        root = self.args.directory or '/'
+        if not root.endswith('/'):
+            root += '/'
+        sizes = {}  # directory -> total bytes below it
+        files = DuCommand._files(root, sizes, self.args.max_depth,
+                                 self.args.max_concurrency)
+        for paths, metas, error in iter_file_meta(
+                files, parallel=self.args.max_concurrency):
+            if error:
+                print_warn('Could not fetch size of {} files: {}'.format(
+                    len(paths), error))
+            for m in metas:
+                size = int(m.get('__size__') or 0)
+                d = os.path.dirname(
+                    strip_version(m['_id'])).rstrip('/') + '/'
+                while True:
+                    sizes[d] = sizes.get(d, 0) + size
+                    if d == root or len(d) <= len(root):
+                        break
+                    d = os.path.dirname(d.rstrip('/')).rstrip('/') + '/'
+
+        if self.args.print_depth is None:
+            shown = sorted(sizes)
+        else:
+            depth = self.args.print_depth
+            shown = sorted(d for d in sizes
+                           if d[len(root):].count('/') <= depth)
+        if not PrettyPrint.is_text():
+            PrettyPrint.records({'path': d, 'size': sizes[d]} for d in shown)
+            return
+        fmt = str if self.args.bytes else bytes_to_size
+        PrettyPrint.aligned_print([[fmt(sizes[d]), d] for d in shown],
+                                  [Alignment.RIGHT, Alignment.LEFT])
+
+    @staticmethod
+    def _files(root, sizes, max_depth, parallel):
+        """Versioned paths of all files under root, found by a concurrent
+        breadth first walk. Registers every directory in ``sizes``."""
+        for directory, entries in walk_tree(root, max_depth, parallel,
+                                            list_dir=cache.list_dir):
+            sizes.setdefault(directory, 0)
+            for e in entries:
+                if not e['is_dir']:
+                    yield '{}:{}'.format(os.path.join(directory, e['path']),
+                                         e['version'])
+
+
+class SyncCommand(Command):
+    def process(self):
+        if not os.path.isdir(self.args.local_dir):
+            raise AcaiException('{} is not a local directory'.format(
+                self.args.local_dir))
+        sync = Sync(self.args.local_dir, self.args.remote_dir,
+                    jobs=self.args.jobs)
+        try:
+            plan = sync.plan(self.args.prefer, self.args.delete)
+            for rel in plan.remote_deletes:
+                print_warn('Deleted locally, remote deletion is not '
+                           'supported: {}'.format(rel))
+
+            if self.args.dry_run:
+                for rel in plan.conflicts:
+                    print_warn('Conflict, changed on both sides: {}'
+                               .format(rel))
+                print_info('[DRY RUN] Changes to be synced:')
+                for prefix, paths in (('>', plan.uploads),
+                                      ('<', plan.downloads),
+                                      ('-', plan.local_deletes),
+                                      ('?', plan.adopted)):
+                    for rel in paths:
+                        print('{} {}'.format(prefix, rel))
+                return
+
+            failed = sync.execute(plan)
+        finally:
+            sync.close()
+        for rel in plan.conflicts:
+            print_warn('Conflict, changed on both sides: {}'.format(rel))
+        for path, e in failed:
+            print_err('Failed to sync {}: {}'.format(path, e))
+        if plan.uploads:
+            cache.invalidate_files()
+        print_info('{} transferred, {} failed, {} deleted, {} conflicts'
+                   .format(len(plan.uploads) + len(plan.downloads)
+                           - len(failed), len(failed),
+                           len(plan.local_deletes), len(plan.conflicts)))
+        if failed or plan.conflicts:
+            exit(1)
+
+
+class BatchCommand(Command):
+    """Runs many acai commands in one process.
+
+    One ArgumentLoader is reused for all commands, the SDK modules stay
+    loaded in between and all requests go through one pooled HTTP
+    session, so each command only pays for its own requests.
+    """
+
+    def __init__(self, args):
+        super().__init__(args)
+        from argparser import ArgumentLoader
+        import httpsession
+        self.loader = ArgumentLoader()
+        httpsession.share()
+
+    def process(self):
+        if self.args.file:
+            with open(self.args.file) as f:
+                failed = self.run_lines(f, self.args.jobs)
+        else:
+            failed = self.run_lines(sys.stdin, self.args.jobs)
+        if failed:
+            print_err('{} commands failed'.format(failed))
+            exit(1)
+
+    def run_lines(self, lines, jobs: int = 1) -> int:
+        """Parse commands one line at a time (the parser works on sys.argv)
+        and run up to ``jobs`` of them at once.
+
+        :return: number of failed commands
+        """
+        from concurrent.futures import ThreadPoolExecutor, wait, \
+            FIRST_COMPLETED
+        failed = 0
+        with ThreadPoolExecutor(max(1, jobs)) as pool:
+            pending = set()
+            for line in lines:
+                action = self._parse_line(line)
+                if action is False:
+                    failed += 1
+                if not action:
+                    continue
+                if len(pending) >= jobs:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    failed += sum(not f.result() for f in done)
+                pending.add(pool.submit(self._run, line.strip(), action))
+            failed += sum(not f.result() for f in wait(pending)[0])
+        return failed
+
+    def _parse_line(self, line: str):
+        """:return: the Command, None for blank lines and comments,
+        False when the line cannot be parsed."""
+        try:
+            argv = shlex.split(line, comments=True)
+        except ValueError as e:
+            print_err('{}: {}'.format(line.strip(), e))
+            return False
+        if argv and argv[0] == self.loader.file_name:
+            argv = argv[1:]
+        if not argv:
+            return None
+        sys_argv_backup = sys.argv
+        try:
+            return self.loader.parse(argv)[1]
+        except SystemExit:
+            return False
+        finally:
+            sys.argv = sys_argv_backup
+
+    @staticmethod
+    def _run(line: str, action: Command) -> bool:
+        try:
+            # Own context, so the command's global options stay its own
+            contextvars.copy_context().run(action.process)
+            return True
+        except SystemExit as e:
+            return e.code in (None, 0)
+        except Exception as e:
+            print_err('{}: {}'.format(line, e))
+            return False
+
+
+class ShellCommand(BatchCommand):
+    def process(self):
+        if not sys.stdin.isatty():
+            # Piped in, behave like "acai batch"
+            if self.run_lines(sys.stdin):
+                exit(1)
+            return
+        while True:
+            try:
+                line = input('acai> ')
+            except (EOFError, KeyboardInterrupt):
+                print()
+                return
+            if line.strip() in ('exit', 'quit'):
+                return
+            self.run_lines([line])
@@ -0,0 +1,37 @@
+import itertools
+import collections
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator, List
+
+DEFAULT_PARALLEL = 8
+
+
+def chunked(items: Iterable, size: int) -> Iterator[List]:
+    it = iter(items)
+    while True:
+        chunk = list(itertools.islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def ordered_map(fn: Callable, items: Iterable,
+                parallel: int = DEFAULT_PARALLEL) -> Iterator:
+    """Like map(), with up to ``parallel`` calls running at once.
+
+    Results come back in input order as soon as they are ready, and at
+    most ``2 * parallel`` inputs are taken ahead of the consumer, so
+    ``items`` can be a lazy stream. Calls run in a copy of the caller's
+    context, so they see its --output and cache mode.
+    """
+    parallel = max(1, parallel)
+    with ThreadPoolExecutor(parallel) as pool:
+        pending = collections.deque()
+        for item in items:
+            pending.append(pool.submit(contextvars.copy_context().run,
+                                       fn, item))
+            if len(pending) >= 2 * parallel:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
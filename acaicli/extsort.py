@@ -0,0 +1,37 @@
+import heapq
+import itertools
+import tempfile
+from typing import Iterable, Iterator
+
+# Number of items sorted in memory before spilling a run to disk.
+DEFAULT_RUN_SIZE = 200000
+
+
+def external_sort(items: Iterable[str],
+                  run_size: int = DEFAULT_RUN_SIZE) -> Iterator[str]:
+    """Sort strings (without newlines) with bounded memory.
+
+    Inputs that fit in one run are sorted in memory. Larger inputs are cut
+    into sorted runs written to temporary files and merged lazily, so at
+    most ``run_size`` items are held at a time.
+    """
+    it = iter(items)
+    run = list(itertools.islice(it, run_size))
+    if len(run) < run_size:
+        yield from sorted(run)
+        return
+
+    files = []
+    try:
+        while run:
+            run.sort()
+            f = tempfile.TemporaryFile('w+', encoding='utf-8')
+            f.writelines(s + '\n' for s in run)
+            f.seek(0)
+            files.append(f)
+            run = list(itertools.islice(it, run_size))
+        readers = [(line[:-1] for line in f) for f in files]
+        yield from heapq.merge(*readers)
+    finally:
+        for f in files:
+            f.close()
@@ -0,0 +1,121 @@
+import sys
+import csv
+import json
+from typing import Iterable, Dict, List
+
+FORMATS = ['text', 'json', 'ndjson', 'csv', 'tsv']
+# Records are serialized and written this many at a time.
+BLOCK_RECORDS = 4096
+
+
+class Formatter:
+    """Writes a stream of records (flat dicts) in a machine-readable
+    format. Records are written in blocks as they come in, nothing is
+    collected.
+    """
+
+    def __init__(self, out=None):
+        self.out = out or sys.stdout
+
+    def write_all(self, records: Iterable[Dict]) -> None:
+        self.begin()
+        block = []
+        for r in records:
+            block.append(r)
+            if len(block) >= BLOCK_RECORDS:
+                self.write_block(block)
+                block = []
+        if block:
+            self.write_block(block)
+        self.end()
+
+    def begin(self):
+        pass
+
+    def write_block(self, records: List[Dict]):
+        raise NotImplementedError
+
+    def end(self):
+        self.out.flush()
+
+
+class NdjsonFormatter(Formatter):
+    def __init__(self, out=None):
+        super().__init__(out)
+        self.encode = json.JSONEncoder(separators=(',', ':'),
+                                       default=str).encode
+
+    def write_block(self, records):
+        self.out.write('\n'.join(map(self.encode, records)))
+        self.out.write('\n')
+
+
+class JsonFormatter(NdjsonFormatter):
+    """One JSON array, streamed element by element."""
+
+    def begin(self):
+        self.first = True
+        self.out.write('[')
+
+    def write_block(self, records):
+        if not self.first:
+            self.out.write(',\n')
+        self.first = False
+        self.out.write(',\n'.join(map(self.encode, records)))
+
+    def end(self):
+        self.out.write(']\n')
+        super().end()
+
+
+class CsvFormatter(Formatter):
+    """Columns are the keys of the first block of records, in the order
+    they first appear. Keys only showing up later cannot become columns
+    once the header is written; they are dropped with a warning, use
+    --fields to choose the columns. Nested values are written as JSON."""
+
+    def __init__(self, out=None, delimiter=','):
+        super().__init__(out)
+        self.delimiter = delimiter
+        self.writer = None
+        self.dropped = set()
+
+    def write_block(self, records):
+        if self.writer is None:
+            self.fields = list(dict.fromkeys(
+                k for r in records for k in r.keys()))
+            self.known = set(self.fields)
+            self.writer = csv.writer(self.out, delimiter=self.delimiter,
+                                     lineterminator='\n')
+            self.writer.writerow(self.fields)
+        else:
+            new = {k for r in records for k in r.keys()} - self.known
+            if new - self.dropped:
+                # Not on stdout, which holds the table
+                sys.stderr.write('Dropping fields missing from the first '
+                                 '{} records: {}\n'.format(
+                                     BLOCK_RECORDS,
+                                     ', '.join(sorted(new - self.dropped))))
+                self.dropped |= new
+        self.writer.writerows([[self._cell(r.get(f)) for f in self.fields]
+                               for r in records])
+
+    @staticmethod
+    def _cell(v):
+        if v is None:
+            return ''
+        if isinstance(v, (dict, list)):
+            return json.dumps(v, separators=(',', ':'), default=str)
+        return v
+
+
+def get_formatter(name: str, out=None) -> Formatter:
+    if name == 'json':
+        return JsonFormatter(out)
+    if name == 'ndjson':
+        return NdjsonFormatter(out)
+    if name == 'csv':
+        return CsvFormatter(out)
+    if name == 'tsv':
+        return CsvFormatter(out, delimiter='\t')
+    raise ValueError('Unknown output format {}'.format(name))
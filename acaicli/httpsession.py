@@ -0,0 +1,70 @@
+"""One pooled HTTP session for a long running process.
+
+``requests.get`` and the other module level functions of requests open a
+new Session, and with it new connections, on every call. :func:`share`
+sends them all through one Session instead, so that ``acai batch`` and
+``acai shell`` keep their connections to the backend alive from one
+command to the next and only pay for the TLS handshake once per host.
+"""
+import threading
+
+# Connections kept per host, enough for the parallel listings and
+# transfers of several commands running at once
+POOL_SIZE = 64
+
+_session = None
+_lock = threading.Lock()
+
+
+def share(pool_size: int = POOL_SIZE) -> None:
+    """Route all requests made through the requests module functions
+    over one Session. Does nothing without requests, or when already
+    shared."""
+    global _session
+    with _lock:
+        if _session is not None:
+            return
+        try:
+            import requests
+            import requests.api
+            from requests.adapters import HTTPAdapter
+        except ImportError:
+            return
+        _session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size,
+                              pool_maxsize=pool_size)
+        _session.mount('http://', adapter)
+        _session.mount('https://', adapter)
+
+        # Same signatures as in requests.api
+        def request(method, url, **kwargs):
+            return _session.request(method, url, **kwargs)
+
+        def get(url, params=None, **kwargs):
+            return request('GET', url, params=params, **kwargs)
+
+        def options(url, **kwargs):
+            return request('OPTIONS', url, **kwargs)
+
+        def head(url, **kwargs):
+            kwargs.setdefault('allow_redirects', False)
+            return request('HEAD', url, **kwargs)
+
+        def post(url, data=None, json=None, **kwargs):
+            return request('POST', url, data=data, json=json, **kwargs)
+
+        def put(url, data=None, **kwargs):
+            return request('PUT', url, data=data, **kwargs)
+
+        def patch(url, data=None, **kwargs):
+            return request('PATCH', url, data=data, **kwargs)
+
+        def delete(url, **kwargs):
+            return request('DELETE', url, **kwargs)
+
+        functions = {'request': request, 'get': get, 'options': options,
+                     'head': head, 'post': post, 'put': put,
+                     'patch': patch, 'delete': delete}
+        for module in (requests, requests.api):
+            for name, f in functions.items():
+                setattr(module, name, f)
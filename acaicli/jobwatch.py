@@ -0,0 +1,163 @@
+import time
+import heapq
+from typing import Callable, Dict, Iterable, List, Tuple
+from cliutils import LazyImport
+from concurrency import ordered_map
+
+Job = LazyImport('acaisdk.job', 'Job')
+
+TERMINAL = {'FINISHED', 'FAILED', 'KILLED', 'CANCELLED', 'ERROR'}
+SUCCEEDED = 'FINISHED'
+UNKNOWN = 'UNKNOWN'
+# Given to a job whose status could not be fetched MAX_ERRORS times in a
+# row. It counts as failed and is not polled anymore.
+UNREACHABLE = 'UNREACHABLE'
+MAX_ERRORS = 5
+
+# Seconds between two polls of the same job. The interval grows while
+# the status does not change and starts over when it does.
+MIN_INTERVAL = 2.0
+MAX_INTERVAL = 60.0
+BACKOFF = 1.5
+
+
+def job_status(job_id) -> str:
+    """Status name of a job, e.g. "RUNNING"."""
+    status = Job.find(job_id).status()
+    return str(getattr(status, 'name', status)).split('.')[-1].upper()
+
+
+class JobWatcher:
+    """Tracks the status of many jobs in one polling loop.
+
+    Every job has its own next poll time with exponential backoff, so
+    long running jobs are polled rarely and recently changed ones often.
+    The jobs due in a round are polled together with at most ``parallel``
+    requests in flight. ``errors`` holds the last polling error of each
+    job until its status is fetched again.
+    """
+    TERMINAL = TERMINAL
+    SUCCEEDED = SUCCEEDED
+    UNREACHABLE = UNREACHABLE
+
+    def __init__(self, job_ids: Iterable, parallel: int = 16,
+                 status_fn: Callable = job_status,
+                 min_interval: float = MIN_INTERVAL,
+                 max_interval: float = MAX_INTERVAL,
+                 max_errors: int = MAX_ERRORS):
+        self.status = {j: UNKNOWN for j in job_ids}  # type: Dict
+        self.errors = {}  # type: Dict
+        self.error_count = {}  # type: Dict
+        self.max_errors = max_errors
+        self.parallel = parallel
+        self.status_fn = status_fn
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = {j: min_interval for j in self.status}
+        # (next poll time, job id)
+        self.due = [(0.0, j) for j in self.status]
+        heapq.heapify(self.due)
+        self.requests = 0
+
+    def done(self) -> bool:
+        return not self.due
+
+    def counts(self) -> Dict[str, int]:
+        counts = {}
+        for s in self.status.values():
+            counts[s] = counts.get(s, 0) + 1
+        return counts
+
+    def poll(self, timeout: float = None) -> List[Tuple[object, str, str]]:
+        """Wait until the next jobs are due and poll them. Waits at most
+        ``timeout`` seconds, and polls nothing if no job got due by then.
+
+        :return: list of (job id, old status, new status) that changed
+        """
+        if not self.due:
+            return []
+        delay = self.due[0][0] - time.monotonic()
+        if timeout is not None and delay > timeout:
+            time.sleep(max(timeout, 0))
+            return []
+        if delay > 0:
+            time.sleep(delay)
+        now = time.monotonic()
+        batch = []
+        while self.due and self.due[0][0] <= now:
+            batch.append(heapq.heappop(self.due)[1])
+
+        def fetch(job_id):
+            try:
+                return job_id, self.status_fn(job_id), None
+            except Exception as e:
+                return job_id, None, e
+
+        changes = []
+        now = time.monotonic()
+        for job_id, status, error in ordered_map(fetch, batch,
+                                                 self.parallel):
+            self.requests += 1
+            old = self.status[job_id]
+            if error:
+                # Re-inserted, so the latest error comes last
+                self.errors.pop(job_id, None)
+                self.errors[job_id] = error
+                self.error_count[job_id] = \
+                    self.error_count.get(job_id, 0) + 1
+                if self.error_count[job_id] >= self.max_errors:
+                    self.status[job_id] = UNREACHABLE
+                    changes.append((job_id, old, UNREACHABLE))
+                    continue
+            else:
+                self.errors.pop(job_id, None)
+                self.error_count.pop(job_id, None)
+            if error or status == old:
+                self.interval[job_id] = min(
+                    self.interval[job_id] * BACKOFF, self.max_interval)
+            else:
+                self.status[job_id] = status
+                changes.append((job_id, old, status))
+                self.interval[job_id] = self.min_interval
+                if status in TERMINAL:
+                    continue
+            heapq.heappush(self.due, (now + self.interval[job_id], job_id))
+        return changes
+
+    def failed(self) -> List:
+        return [j for j, s in self.status.items() if s != SUCCEEDED]
+
+
+class StatusBoard:
+    """Status counts and the latest changes, redrawn in place."""
+
+    def __init__(self, out, recent: int = 10):
+        self.out = out
+        self.recent = []  # type: List[str]
+        self.max_recent = recent
+        self.lines = 0
+        self.start = time.monotonic()
+
+    def draw(self, watcher: JobWatcher, changes: List) -> None:
+        for job_id, old, new in changes:
+            self.recent.append('{:>8}  {} -> {}'.format(job_id, old, new))
+        self.recent = self.recent[-self.max_recent:]
+        counts = ', '.join('{} {}'.format(n, s) for s, n
+                           in sorted(watcher.counts().items()))
+        lines = ['{} jobs: {}  [{:.0f}s, {} requests]'.format(
+            len(watcher.status), counts, time.monotonic() - self.start,
+            watcher.requests)]
+        if watcher.errors:
+            job_id, error = list(watcher.errors.items())[-1]
+            lines.append('{} jobs with polling errors, last: {}: {}'.format(
+                len(watcher.errors), job_id,
+                str(error).replace('\n', ' ')))
+        lines += self.recent
+        # Blank out what is left of a longer previous board
+        lines += [''] * (self.lines - len(lines))
+        if self.lines:
+            # Back to the start of the previous board
+            self.out.write('\033[{}F'.format(self.lines))
+        self.out.write(''.join('\033[2K' + l + '\n' for l in lines))
+        self.out.flush()
+        self.lines = len(lines)
@@ -0,0 +1,56 @@
+from typing import Dict, Iterable, Iterator, List
+from concurrency import chunked, ordered_map, DEFAULT_PARALLEL
+from metafetch import iter_file_meta
+from walk import walk_files
+from cliutils import print_warn
+import cache
+
+# Jobs whose output files are looked up and joined together. Bounds the
+# size of the file -> jobs hash table.
+JOBS_PER_ROUND = 100
+
+
+def job_output_files(jobs: Iterable[Dict], key: str = 'output_path',
+                     parallel: int = DEFAULT_PARALLEL) -> Iterator[Dict]:
+    """Output files of jobs, with their metadata.
+
+    For each job, the location at ``key`` (a remote directory, or a file
+    set as "@NAME") is listed concurrently, then the metadata of all files
+    is fetched in concurrent batches and joined back to the jobs through
+    a hash table on the file id.
+
+    Yields one record per (job, file): the file metadata plus "job_id".
+    Jobs without ``key`` produce nothing.
+    """
+    for round_jobs in chunked(jobs, JOBS_PER_ROUND):
+        file_to_jobs = {}  # type: Dict[str, List]
+        listed = ordered_map(lambda j: (j, _list_output(j, key)),
+                             round_jobs, parallel)
+        for job, files in listed:
+            for f in files:
+                file_to_jobs.setdefault(f, []).append(job['_id'])
+
+        for paths, metas, error in iter_file_meta(list(file_to_jobs),
+                                                  parallel=parallel):
+            by_id = {m['_id']: m for m in metas}
+            for path in paths:
+                meta = by_id.get(path, {'_id': path})
+                for job_id in file_to_jobs[path]:
+                    yield dict(meta, job_id=job_id)
+
+
+def _list_output(job: Dict, key: str) -> List[str]:
+    location = job.get(key)
+    if not location:
+        return []
+    location = str(location)
+    try:
+        if location.startswith('@'):
+            return cache.list_file_set_content(location[1:])['files']
+        if not location.endswith('/'):
+            location += '/'
+        return [remote for remote, _ in walk_files(location)]
+    except Exception as e:
+        print_warn('Cannot list output {} of job {}: {}'.format(
+            location, job['_id'], e))
+        return []
@@ -0,0 +1,176 @@
+"""File sets as lazily fetched local directory trees.
+
+:class:`LazyFileSet` knows the tree of a file set (paths and sizes) but
+downloads a file only when it is first opened. Fetched files live in the
+:class:`BlobStore`, which is pruned to a size bound, so reading a few
+files of a huge file set only costs those files. Opening a file also
+prefetches the next few files in path order, since data loaders usually
+read a file set front to back.
+
+From Python, use :meth:`LazyFileSet.open`. ``acai fileset mount`` exposes
+the same tree through FUSE when fusepy is installed.
+"""
+import os
+import errno
+import stat
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Dict, List
+from acaisdk.utils.exceptions import AcaiException
+from cliutils import print_info
+from blobstore import BlobStore
+from metafetch import iter_file_meta
+from transfer import Downloader, strip_version
+import cache
+
+DEFAULT_READ_AHEAD = 4
+DEFAULT_CACHE_BYTES = 10 * 1024 * 1024 * 1024
+
+
+class LazyFileSet:
+    def __init__(self, file_set: str, store: BlobStore = None,
+                 jobs: int = 4, read_ahead: int = DEFAULT_READ_AHEAD,
+                 cache_bytes: int = DEFAULT_CACHE_BYTES):
+        content = cache.list_file_set_content(file_set)
+        self.id = content['id']
+        self.store = store or BlobStore()
+        self.read_ahead = read_ahead
+        self.cache_bytes = cache_bytes
+        # Manifest: relative path -> versioned remote path
+        self.files = {strip_version(f).lstrip('/'): f
+                      for f in content['files']}  # type: Dict[str, str]
+        self.order = sorted(self.files)
+        self.index = {rel: i for i, rel in enumerate(self.order)}
+        metas = {}
+        for paths, batch, error in iter_file_meta(self.files.values()):
+            if error:
+                raise AcaiException('Cannot get the sizes of {} files of {}: '
+                                    '{}'.format(len(paths), self.id, error))
+            metas.update((d['_id'], d) for d in batch)
+        self.sizes = {rel: int(metas.get(f, {}).get('__size__') or 0)
+                      for rel, f in self.files.items()}
+        self.dirs = {'': set()}  # type: Dict[str, set]
+        for rel in self.order:
+            child = rel
+            while child:
+                parent = os.path.dirname(child)
+                known = parent in self.dirs
+                self.dirs.setdefault(parent, set()).add(
+                    os.path.basename(child))
+                if known:
+                    break
+                child = parent
+        self.pool = ThreadPoolExecutor(max(1, jobs))
+        self.lock = threading.Lock()
+        self.pending = {}  # type: Dict[str, Future]
+        # Files most recently asked for, their blobs are not evicted
+        # before the caller had a chance to open them
+        self.recent = deque(maxlen=max(1, jobs))
+
+    def isdir(self, rel: str) -> bool:
+        return rel.strip('/') in self.dirs
+
+    def listdir(self, rel: str) -> List[str]:
+        try:
+            return sorted(self.dirs[rel.strip('/')])
+        except KeyError:
+            raise FileNotFoundError(rel)
+
+    def size(self, rel: str) -> int:
+        try:
+            return self.sizes[rel.strip('/')]
+        except KeyError:
+            raise FileNotFoundError(rel)
+
+    def local_path(self, rel: str) -> str:
+        """Path of the fetched file, downloading it if needed."""
+        rel = rel.strip('/')
+        if rel not in self.files:
+            raise FileNotFoundError(rel)
+        with self.lock:
+            self.recent.append(rel)
+        future = self._fetch(rel)
+        i = self.index[rel]
+        for nxt in self.order[i + 1:i + 1 + self.read_ahead]:
+            self._fetch(nxt)
+        return future.result()
+
+    def open(self, rel: str, mode: str = 'rb'):
+        if any(c in mode for c in 'wax+'):
+            raise AcaiException('File sets are read-only')
+        return open(self.local_path(rel), mode)
+
+    def _fetch(self, rel) -> Future:
+        with self.lock:
+            future = self.pending.get(rel)
+            if future is None or future.done() and future.exception():
+                future = self.pool.submit(self._fetch_one, rel)
+                self.pending[rel] = future
+            return future
+
+    def _fetch_one(self, rel):
+        key = self.files[rel]
+        blob = self.store.lookup(key)
+        if blob is None:
+            blob, error = self.store.fetch(
+                [key], downloader=Downloader(jobs=1))[key]
+            if error:
+                raise error
+            # Fetches still running include this one, it is only
+            # forgotten below
+            with self.lock:
+                keep = [self.files[r] for r in
+                        set(self.pending) | set(self.recent)]
+            self.store.prune(self.cache_bytes, keep=keep)
+        with self.lock:
+            # Forget finished fetches, the blob may get evicted later
+            self.pending.pop(rel, None)
+        return blob
+
+    def close(self):
+        self.pool.shutdown(wait=False)
+        self.store.close()
+
+
+def mount(lazy: LazyFileSet, mount_point: str) -> None:
+    """Serve ``lazy`` read-only at ``mount_point`` until unmounted."""
+    try:
+        import fuse
+    except ImportError:
+        raise AcaiException('Mounting needs fusepy: pip install fusepy')
+    print_info('Serving {} ({} files) at {}'.format(
+        lazy.id, len(lazy.files), mount_point))
+
+    class Operations(fuse.Operations):
+        def getattr(self, path, fh=None):
+            if lazy.isdir(path):
+                return {'st_mode': stat.S_IFDIR | 0o555, 'st_nlink': 2}
+            try:
+                size = lazy.size(path)
+            except FileNotFoundError:
+                raise fuse.FuseOSError(errno.ENOENT)
+            return {'st_mode': stat.S_IFREG | 0o444, 'st_nlink': 1,
+                    'st_size': size}
+
+        def readdir(self, path, fh):
+            return ['.', '..'] + lazy.listdir(path)
+
+        def open(self, path, flags):
+            if flags & (os.O_WRONLY | os.O_RDWR):
+                raise fuse.FuseOSError(errno.EROFS)
+            try:
+                return os.open(lazy.local_path(path), os.O_RDONLY)
+            except FileNotFoundError:
+                raise fuse.FuseOSError(errno.ENOENT)
+            except Exception:
+                raise fuse.FuseOSError(errno.EIO)
+
+        def read(self, path, size, offset, fh):
+            return os.pread(fh, size, offset)
+
+        def release(self, path, fh):
+            os.close(fh)
+
+    fuse.FUSE(Operations(), mount_point, foreground=True, ro=True,
+              nothreads=False)
@@ -1,3 +1,5 @@
+import os
+import sys
 from argparser import ArgumentLoader
 from acaisdk.utils import utils
 
@@ -5,7 +7,14 @@ from acaisdk.utils import utils
 def main():
     utils.IS_CLI = True
     args, action = ArgumentLoader().parse()
-    action.process()
+    try:
+        action.process()
+        sys.stdout.flush()
+    except BrokenPipeError:
+        # Output piped into e.g. "head" which exited early. Point stdout
+        # at devnull so the final flush at exit does not fail again.
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        exit(1)
 
 
 if __name__ == "__main__":
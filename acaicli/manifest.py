@@ -0,0 +1,73 @@
+import os
+import sqlite3
+import hashlib
+from typing import Iterable, Tuple, Iterator
+from cliutils import CACHE_DIR
+
+DEFAULT_PATH = os.path.join(CACHE_DIR, 'manifest.sqlite')
+_HASH_BUF_SIZE = 1024 * 1024
+
+
+def hash_file(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            buf = f.read(_HASH_BUF_SIZE)
+            if not buf:
+                break
+            h.update(buf)
+    return h.hexdigest()
+
+
+class Manifest:
+    """Local index of what has been uploaded where.
+
+    One row per (local path, remote path) with the size, mtime and sha256
+    of the local file at upload time. A file whose size and mtime did not
+    change is considered unchanged without reading it; only when the mtime
+    moved is the content hashed again.
+    """
+
+    def __init__(self, path: str = DEFAULT_PATH):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('CREATE TABLE IF NOT EXISTS manifest ('
+                          'local_path TEXT, remote_path TEXT, '
+                          'size INTEGER, mtime_ns INTEGER, sha256 TEXT, '
+                          'PRIMARY KEY (local_path, remote_path))')
+
+    def classify(self, l_r_mapping: Iterable[Tuple[str, str]]) \
+            -> Iterator[Tuple[str, str, bool]]:
+        """Yield (local, remote, changed) for every pair."""
+        for l, r in l_r_mapping:
+            st = os.stat(l)
+            row = self.conn.execute(
+                'SELECT size, mtime_ns, sha256 FROM manifest '
+                'WHERE local_path = ? AND remote_path = ?',
+                (os.path.abspath(l), r)).fetchone()
+            if row is None or row[0] != st.st_size:
+                yield l, r, True
+            elif row[1] == st.st_mtime_ns:
+                yield l, r, False
+            else:
+                # Touched but maybe not modified
+                digest = hash_file(l)
+                if digest == row[2]:
+                    self._put(l, r, st, digest)
+                    yield l, r, False
+                else:
+                    yield l, r, True
+
+    def record(self, uploaded: Iterable[Tuple[str, str]]) -> None:
+        for l, r in uploaded:
+            self._put(l, r, os.stat(l), hash_file(l))
+        self.conn.commit()
+
+    def _put(self, l, r, st, digest):
+        self.conn.execute(
+            'INSERT OR REPLACE INTO manifest VALUES (?, ?, ?, ?, ?)',
+            (os.path.abspath(l), r, st.st_size, st.st_mtime_ns, digest))
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
@@ -0,0 +1,36 @@
+from typing import Iterable, Iterator, List, Tuple, Optional, Dict
+from concurrency import chunked, ordered_map, DEFAULT_PARALLEL
+import cache
+
+# Paths per Meta.get_file_meta request, keeps requests well below the
+# server's size limit.
+DEFAULT_BATCH_SIZE = 200
+
+
+def iter_file_meta(paths: Iterable[str],
+                   batch_size: int = DEFAULT_BATCH_SIZE,
+                   parallel: int = DEFAULT_PARALLEL) \
+        -> Iterator[Tuple[List[str], List[Dict], Optional[Exception]]]:
+    """Fetch file metadata in concurrent batches.
+
+    Yields (paths, metas, error) per batch in input order, as soon as the
+    batch is done. A failed batch yields no metas and the error instead of
+    failing the whole fetch.
+    """
+    def fetch(batch):
+        try:
+            return batch, cache.get_file_meta(*batch)['data'], None
+        except Exception as e:
+            return batch, [], e
+
+    return ordered_map(fetch, chunked(paths, batch_size), parallel)
+
+
+def get_file_meta(paths: Iterable[str],
+                  batch_size: int = DEFAULT_BATCH_SIZE,
+                  parallel: int = DEFAULT_PARALLEL) -> Dict[str, Dict]:
+    """All metadata of ``paths`` as {_id: meta}. Paths in failed batches
+    are left out."""
+    return {d['_id']: d
+            for _, metas, _ in iter_file_meta(paths, batch_size, parallel)
+            for d in metas}
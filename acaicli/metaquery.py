@@ -0,0 +1,35 @@
+import itertools
+from typing import Dict, Iterable, Iterator, List, Callable
+
+DEFAULT_PAGE_SIZE = 1000
+
+
+def find_pages(find_method: Callable, constraints: List,
+               page_size: int = DEFAULT_PAGE_SIZE) -> Iterator[List[Dict]]:
+    """Results of a ``Meta.find_*`` call, page by page.
+
+    The find API has no cursor and returns the whole result set at once,
+    so pages are cut on the client. Records are handed out and dropped
+    from the response as they go, so a consumer that streams pages out
+    does not keep a second copy of the result set.
+    """
+    data = find_method(*constraints)['data']
+    for start in range(0, len(data), page_size):
+        page = data[start:start + page_size]
+        # Overwritten in place rather than removed, shrinking the list
+        # would copy it
+        data[start:start + page_size] = [None] * len(page)
+        yield page
+
+
+def records(pages: Iterable[List[Dict]], limit: int = None,
+            fields: List[str] = None) -> Iterator[Dict]:
+    """Flatten pages into records, stop after ``limit`` records and keep
+    only "_id" and ``fields`` of each record if given."""
+    it = itertools.chain.from_iterable(pages)
+    if limit is not None:
+        it = itertools.islice(it, limit)
+    if fields:
+        keys = ['_id'] + [f for f in fields if f != '_id']
+        it = ({k: r[k] for k in keys if k in r} for r in it)
+    return it
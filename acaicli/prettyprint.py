@@ -1,8 +1,16 @@
 from datetime import datetime
-from typing import List
+import sys
+import contextvars
+from array import array
+from typing import List, Iterable, Tuple
 from enum import Enum
-from pprint import pprint
 from acaisdk.utils.utils import bytes_to_size
+from cliutils import LazyImport, set_message_stream
+from formatters import get_formatter
+
+# Only needed by the commands sorting or pretty printing
+external_sort = LazyImport('extsort', 'external_sort')
+pprint = LazyImport('pprint', 'pprint')
 
 
 class Alignment(Enum):
@@ -10,13 +18,151 @@ class Alignment(Enum):
     RIGHT = '{{:>{}}}'
 
 
+class MetaTable:
+    """Rows of "ls -l" stored column-wise.
+
+    Sizes and creation times live in typed arrays and are only formatted
+    when written. Formatted timestamps, sizes and user ids are cached, as
+    listings repeat them a lot. Output is written in blocks of
+    ``BLOCK_ROWS`` lines.
+    """
+    # Column widths are computed from at most this many rows, longer
+    # values further down just push their line out of alignment.
+    SAMPLE_ROWS = 10000
+    BLOCK_ROWS = 8192
+    # Columns: FilePath:Version, size, createdBy, createdAt
+    ALIGN = [Alignment.LEFT,
+             Alignment.RIGHT,
+             Alignment.RIGHT,
+             Alignment.RIGHT]
+    _MISSING = -1
+
+    def __init__(self, human_readable_size=True):
+        self.human_readable_size = human_readable_size
+        self.paths = []  # type: List[str]
+        self.sizes = array('q')
+        self.uids = []  # type: List[str]
+        self.created = array('q')  # seconds since epoch
+        self._size_str = {self._MISSING: '-'}
+        self._uid_str = {}
+        self._day_str = {}
+
+    def __len__(self):
+        return len(self.paths)
+
+    def extend(self, file_ids: List[str], files_meta: List[dict]):
+        """Add rows for ``file_ids``, in order. Files without an entry in
+        ``files_meta`` (e.g. directories) get "-" columns."""
+        id_to_meta = {d['_id']: d for d in files_meta}
+        uid_str = self._uid_str
+        for fid in file_ids:
+            self.paths.append(fid)
+            meta = id_to_meta.get(fid)
+            if meta is None:
+                self.sizes.append(self._MISSING)
+                self.uids.append('-')
+                self.created.append(self._MISSING)
+                continue
+            self.sizes.append(int(meta['__size__']))
+            uid = meta['__creator_id__']
+            if uid not in uid_str:
+                uid_str[uid] = str(uid)
+            self.uids.append(uid_str[uid])
+            self.created.append(meta['__create_time__'] // 1000)
+
+    def widths(self, header: List[str], min_widths: List[int]) -> List[int]:
+        n = min(len(self), self.SAMPLE_ROWS)
+        return [max(min_widths[0], len(header[0]),
+                    max(map(len, self.paths), default=0)),
+                max(min_widths[1], len(header[1]),
+                    max((len(self._size(x)) for x in self.sizes[:n]),
+                        default=0)),
+                max(min_widths[2], len(header[2]),
+                    max(map(len, self.uids[:n]), default=0)),
+                max(min_widths[3], len(header[3]),
+                    max((19 for t in self.created[:n]
+                         if t != self._MISSING), default=1))]
+
+    def write(self, widths: List[int], out=None):
+        out = out or sys.stdout
+        w0, w1, w2, w3 = widths
+        for start in range(0, len(self), self.BLOCK_ROWS):
+            end = start + self.BLOCK_ROWS
+            block = zip([p.ljust(w0) for p in self.paths[start:end]],
+                        [self._size(x).rjust(w1)
+                         for x in self.sizes[start:end]],
+                        [u.rjust(w2) for u in self.uids[start:end]],
+                        [self._timestamp(t).rjust(w3)
+                         for t in self.created[start:end]])
+            out.write('\n'.join(map('  '.join, block)))
+            out.write('\n')
+
+    def write_row(self, row: List[str], widths: List[int], out=None):
+        template = '  '.join(a.value.format(w)
+                             for a, w in zip(self.ALIGN, widths))
+        (out or sys.stdout).write(template.format(*row) + '\n')
+
+    def _size(self, size: int) -> str:
+        s = self._size_str.get(size)
+        if s is None:
+            s = bytes_to_size(size) if self.human_readable_size \
+                else str(size)
+            if len(self._size_str) < 100000:
+                self._size_str[size] = s
+        return s
+
+    def _timestamp(self, seconds: int) -> str:
+        """Same as utcfromtimestamp(seconds).strftime('%Y-%m-%d %H:%M:%S'),
+        formatting each date only once."""
+        if seconds == self._MISSING:
+            return '-'
+        day, t = divmod(seconds, 86400)
+        date = self._day_str.get(day)
+        if date is None:
+            date = datetime.utcfromtimestamp(day * 86400) \
+                .strftime('%Y-%m-%d')
+            self._day_str[day] = date
+        return '{} {:02d}:{:02d}:{:02d}'.format(
+            date, t // 3600, t // 60 % 60, t % 60)
+
+
 class PrettyPrint:
+    # Set by the global --output option, per context so that commands of
+    # "acai batch -j" do not change each other's. Anything but "text" is
+    # printed as records through a formatters.Formatter.
+    _output_format = contextvars.ContextVar('output_format', default='text')
+
+    @staticmethod
+    def configure(output_format: str):
+        PrettyPrint._output_format.set(output_format)
+        # Keep stdout for the records
+        set_message_stream(None if output_format == 'text' else sys.stderr)
+
+    @staticmethod
+    def output_format() -> str:
+        return PrettyPrint._output_format.get()
+
+    @staticmethod
+    def is_text() -> bool:
+        return PrettyPrint.output_format() == 'text'
+
     @staticmethod
-    def single_col(data: List, lexi_sort=False):
+    def records(records: Iterable[dict]):
+        get_formatter(PrettyPrint.output_format()).write_all(records)
+
+    @staticmethod
+    def single_col(data: Iterable[str], lexi_sort=False, field='path'):
+        """Print one item per line as the items come in. Sorting spills to
+        disk for large inputs, see :func:`extsort.external_sort`.
+
+        :param field: name of the item in machine-readable output
+        """
         if lexi_sort:
-            data = sorted(data)
-        for l in data:
-            print(l)
+            data = external_sort(data)
+        if not PrettyPrint.is_text():
+            PrettyPrint.records({field: l} for l in data)
+            return
+        sys.stdout.writelines(l + '\n' for l in data)
 
     @staticmethod
     def list_with_meta(file_set, file_ids: List[str], files_meta: List,
@@ -29,53 +175,84 @@ class PrettyPrint:
         :return:
         """
         sorted_file_ids = PrettyPrint.sort_by_type(file_ids)
-        id_to_meta = {d['_id']: d for d in files_meta}  # type: dict
-
-        # Columns: FilePath:Version, size, createdBy, createdAt
-        cols = [
-            ['[{}]'.format(file_set) if file_set else '[/]',
-             'size',
-             'user',
-             'created']
-        ]
-        align = [Alignment.LEFT,
-                 Alignment.RIGHT,
-                 Alignment.RIGHT,
-                 Alignment.RIGHT]
-
-        # Maybe some file_ids does not have meta
-        for fid in sorted_file_ids:
-            if fid in id_to_meta:
-                size = str(id_to_meta[fid]['__size__'])
-                if human_readable_size:
-                    size = bytes_to_size(int(size))
-                uid = str(id_to_meta[fid]['__creator_id__'])
-                created_at = id_to_meta[fid]['__create_time__'] // 1000
-                ts = datetime \
-                    .utcfromtimestamp(created_at) \
-                    .strftime('%Y-%m-%d %H:%M:%S')
-                cols.append([fid, size, uid, ts])
-            else:
-                cols.append([fid, '-', '-', '-'])
-
-        PrettyPrint.aligned_print(cols, align)
+        PrettyPrint.list_with_meta_batches(file_set,
+                                           [(sorted_file_ids, files_meta)],
+                                           human_readable_size)
+
+    @staticmethod
+    def list_with_meta_batches(file_set,
+                               batches: Iterable[Tuple[List[str], List]],
+                               human_readable_size=True,
+                               path_width=0):
+        """Same table as :meth:`list_with_meta`, printed batch by batch.
+
+        Column widths are taken from the first non-empty batch (and
+        ``path_width``, if the longest path is known upfront), so rows are
+        printed while later batches are still being fetched.
+
+        :param batches: (file ids in display order, meta dicts of the
+            files among them)
+        """
+        if not PrettyPrint.is_text():
+            PrettyPrint.records(PrettyPrint.meta_records(batches))
+            return
+        header = ['[{}]'.format(file_set) if file_set else '[/]',
+                  'size',
+                  'user',
+                  'created']
+        widths = None
+        table = MetaTable(human_readable_size)
+        for file_ids, files_meta in batches:
+            table.extend(file_ids, files_meta)
+            if widths is None:
+                if not files_meta:
+                    # Keep rows until there is meta to size columns with
+                    continue
+                widths = table.widths(header, [path_width, 0, 0, 0])
+                table.write_row(header, widths)
+            table.write(widths)
+            table = MetaTable(human_readable_size)
+        if widths is None:
+            widths = table.widths(header, [path_width, 0, 0, 0])
+            table.write_row(header, widths)
+            table.write(widths)
+
+    @staticmethod
+    def meta_records(batches):
+        for file_ids, files_meta in batches:
+            id_to_meta = {d['_id']: d for d in files_meta}
+            for fid in file_ids:
+                meta = id_to_meta.get(fid, {})
+                yield {'path': fid,
+                       'size': meta.get('__size__'),
+                       'user': meta.get('__creator_id__'),
+                       'created': meta.get('__create_time__')}
 
     @staticmethod
     def aligned_print(rows: List[List[str]],
                       alignment: List[Alignment]):
+        template = PrettyPrint._template(rows, alignment)
+        for r in rows:
+            print(template.format(*r))
+
+    @staticmethod
+    def _template(rows: List[List[str]],
+                  alignment: List[Alignment],
+                  min_col_width: List[int] = None) -> str:
         # Loop and set max column width
-        max_col_width = [0, 0, 0, 0]
+        max_col_width = list(min_col_width) if min_col_width \
+            else [0] * len(alignment)
         for row in rows:
             for i, c in enumerate(row):
                 max_col_width[i] = max(max_col_width[i], len(c))
-        # Print
-        template = '  '.join([alignment[i].value.format(w)
-                              for i, w in enumerate(max_col_width)])
-        for r in rows:
-            print(template.format(*r))
+        return '  '.join([alignment[i].value.format(w)
+                          for i, w in enumerate(max_col_width)])
 
     @staticmethod
     def job(j):
+        if not PrettyPrint.is_text():
+            PrettyPrint.records([dict(j.dict, id=j.id)])
+            return
         print('Registered job id: {}'.format(j.id))
         pprint(dict(j.dict))
 
@@ -85,6 +262,21 @@ class PrettyPrint:
         files = [f for f in file_ids if not f.endswith('/')]
         return sorted(dirs) + sorted(files)
 
+    @staticmethod
+    def stream(records: Iterable[dict]):
+        """Print records one by one as they come in."""
+        if not PrettyPrint.is_text():
+            PrettyPrint.records(records)
+            return
+        for r in records:
+            pprint(r)
+
     @staticmethod
     def print(content):
+        if not PrettyPrint.is_text():
+            if not isinstance(content, list):
+                content = [content]
+            PrettyPrint.records(c if isinstance(c, dict) else {'value': c}
+                                for c in content)
+            return
         pprint(content)
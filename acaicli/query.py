@@ -0,0 +1,390 @@
+"""Metadata query expressions for "find --query".
+
+Grammar::
+
+    expr    := and_expr (OR and_expr)*
+    and_expr:= not_expr (AND not_expr)*
+    not_expr:= NOT not_expr | atom
+    atom    := "(" expr ")"
+             | EXISTS "(" KEY ")"
+             | KEY IN "(" VALUE ("," VALUE)* ")"
+             | KEY ("~" | "=~") REGEX
+             | KEY ("=" | "==" | "!=" | "<" | "<=" | ">" | ">=") VALUE
+
+Keywords are case insensitive. Values are numbers, quoted strings or bare
+words, e.g. ``eval_loss < 0.3 and (optimizer in (adam, sgd) or
+not exists(baseline))``. As in the backend, numbers only match numbers and
+strings only strings: ``tag = 7`` does not match the string "7", which is
+written ``tag = "7"``. Numbers with leading zeros such as ``007``, or
+followed by more of a word as in ``2020-01-01``, are bare words.
+
+:func:`plan` splits an expression into conditions the backend can
+evaluate (pushed into ``Meta.find_*``) and the full expression, which is
+always checked locally on the results. Pushed conditions only ever narrow
+the results to a superset of the matches, so the local check keeps the
+answer exact.
+"""
+import re
+import sys
+import math
+import operator
+from typing import Any, Dict, Iterator, List
+from acaisdk.utils.exceptions import AcaiException
+from cliutils import LazyImport
+from metaquery import find_pages, DEFAULT_PAGE_SIZE
+
+Condition = LazyImport('acaisdk.meta', 'Condition')
+
+_TOKEN_RE = re.compile(r'''\s*(?:
+    (?P<num>-?(?:(?:0|[1-9]\d*)(?:\.\d*)?|\.\d+)(?:[eE][-+]?\d+)?)
+        (?![^\s=<>!~(),"'])
+    |(?P<str>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')
+    |(?P<op>==|!=|<=|>=|=~|[=<>~(),])
+    |(?P<word>[^\s=<>!~(),"']+)
+    )''', re.VERBOSE)
+
+_COMPARE = {
+    '=': operator.eq,
+    '==': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+}
+
+
+def _kind(v):
+    """Values of different kinds never compare equal, and are not
+    ordered, like in the backend. Ints and floats are both numbers."""
+    if isinstance(v, bool):
+        return bool
+    if isinstance(v, (int, float)):
+        return float
+    return type(v)
+
+
+def _compare(op: str, a, b) -> bool:
+    if _kind(a) is not _kind(b):
+        return op == '!='
+    try:
+        return _COMPARE[op](a, b)
+    except TypeError:
+        return False
+
+
+class Node:
+    def matches(self, record: Dict) -> bool:
+        raise NotImplementedError
+
+    def conditions(self) -> List:
+        """Backend conditions implied by this node. Only meaningful for
+        nodes that are a conjunct of the whole expression."""
+        return []
+
+
+class And(Node):
+    def __init__(self, children: List[Node]):
+        self.children = children
+
+    def matches(self, record):
+        return all(c.matches(record) for c in self.children)
+
+    def conditions(self):
+        conditions = []
+        lower, upper = {}, {}
+        for c in self.children:
+            if isinstance(c, Compare) and c.is_numeric() \
+                    and c.op in ('>', '>='):
+                lower[c.key] = max(lower.get(c.key, -math.inf),
+                                   c.exclusive_lower())
+            elif isinstance(c, Compare) and c.is_numeric() \
+                    and c.op in ('<', '<='):
+                upper[c.key] = min(upper.get(c.key, math.inf), c.value)
+            else:
+                conditions += c.conditions()
+        # The backend only takes ranges bounded on both sides, an open
+        # side becomes the largest float
+        for k in dict.fromkeys(list(lower) + list(upper)):
+            conditions.append(Condition(k).range(
+                lower.get(k, -sys.float_info.max),
+                upper.get(k, sys.float_info.max)))
+        return conditions
+
+    def __str__(self):
+        return '(' + ' AND '.join(map(str, self.children)) + ')'
+
+
+class Or(Node):
+    def __init__(self, children: List[Node]):
+        self.children = children
+
+    def matches(self, record):
+        return any(c.matches(record) for c in self.children)
+
+    def __str__(self):
+        return '(' + ' OR '.join(map(str, self.children)) + ')'
+
+
+class Not(Node):
+    def __init__(self, child: Node):
+        self.child = child
+
+    def matches(self, record):
+        return not self.child.matches(record)
+
+    def __str__(self):
+        return 'NOT {}'.format(self.child)
+
+
+class Compare(Node):
+    def __init__(self, key: str, op: str, value: Any):
+        self.key = key
+        self.op = op
+        self.value = value
+
+    def is_numeric(self):
+        return _kind(self.value) is float
+
+    def exclusive_lower(self) -> float:
+        """Lower bound as the backend's left exclusive range takes it."""
+        if self.op == '>=':
+            return math.nextafter(float(self.value), -math.inf)
+        return self.value
+
+    def matches(self, record):
+        if self.key not in record:
+            return False
+        return _compare(self.op, record[self.key], self.value)
+
+    def conditions(self):
+        if self.op in ('=', '=='):
+            return [Condition(self.key).value(self.value)]
+        return []
+
+    def __str__(self):
+        return '{} {} {!r}'.format(self.key, self.op, self.value)
+
+
+class In(Node):
+    def __init__(self, key: str, values: List):
+        self.key = key
+        self.values = values
+
+    def matches(self, record):
+        if self.key not in record:
+            return False
+        return any(_compare('=', record[self.key], v) for v in self.values)
+
+    def conditions(self):
+        if len(self.values) == 1:
+            return [Condition(self.key).value(self.values[0])]
+        return []
+
+    def __str__(self):
+        return '{} IN ({})'.format(self.key,
+                                   ', '.join(map(repr, self.values)))
+
+
+class Regex(Node):
+    def __init__(self, key: str, pattern: str):
+        self.key = key
+        self.pattern = pattern
+        try:
+            self.regex = re.compile(pattern)
+        except re.error as e:
+            raise AcaiException('Bad regex {!r}: {}'.format(pattern, e))
+
+    def matches(self, record):
+        return self.key in record \
+            and self.regex.search(str(record[self.key])) is not None
+
+    def conditions(self):
+        return [Condition(self.key).value(self.pattern).re()]
+
+    def __str__(self):
+        return '{} ~ {!r}'.format(self.key, self.pattern)
+
+
+class Exists(Node):
+    def __init__(self, key: str):
+        self.key = key
+
+    def matches(self, record):
+        return self.key in record
+
+    def __str__(self):
+        return 'EXISTS({})'.format(self.key)
+
+
+class _Parser:
+    def __init__(self, text: str):
+        self.tokens = self._tokenize(text)
+        self.pos = 0
+
+    @staticmethod
+    def _tokenize(text):
+        tokens, pos = [], 0
+        text = text.strip()
+        while pos < len(text):
+            m = _TOKEN_RE.match(text, pos)
+            if not m or m.end() == pos:
+                raise AcaiException(
+                    'Cannot parse query at "{}"'.format(text[pos:]))
+            pos = m.end()
+            kind = m.lastgroup
+            source = m.group(kind)
+            if kind == 'num':
+                value = float(source) if re.search(r'[.eE]', source) \
+                    else int(source)
+            elif kind == 'str':
+                value = source = re.sub(r'\\(.)', r'\1', source[1:-1])
+            else:
+                value = source
+            # The source text is kept for regexes, "~ 1.50" is not "1.5"
+            tokens.append((kind, value, source))
+        return tokens
+
+    def peek(self, *words):
+        if self.pos >= len(self.tokens):
+            return False
+        kind, value, _ = self.tokens[self.pos]
+        if kind == 'word':
+            return value.lower() in words
+        return kind == 'op' and value in words
+
+    def next(self):
+        if self.pos >= len(self.tokens):
+            raise AcaiException('Unexpected end of query')
+        self.pos += 1
+        return self.tokens[self.pos - 1]
+
+    def expect(self, op):
+        kind, value, _ = self.next()
+        if kind != 'op' or value != op:
+            raise AcaiException('Expected "{}", got "{}"'.format(op, value))
+
+    def parse(self) -> Node:
+        node = self.parse_or()
+        if self.pos != len(self.tokens):
+            raise AcaiException(
+                'Unexpected "{}" in query'.format(self.tokens[self.pos][1]))
+        return node
+
+    def parse_or(self):
+        children = [self.parse_and()]
+        while self.peek('or'):
+            self.next()
+            children.append(self.parse_and())
+        return children[0] if len(children) == 1 else Or(children)
+
+    def parse_and(self):
+        children = [self.parse_not()]
+        while self.peek('and'):
+            self.next()
+            children.append(self.parse_not())
+        return children[0] if len(children) == 1 else And(children)
+
+    def parse_not(self):
+        if self.peek('not'):
+            self.next()
+            return Not(self.parse_not())
+        return self.parse_atom()
+
+    def parse_atom(self):
+        if self.peek('('):
+            self.next()
+            node = self.parse_or()
+            self.expect(')')
+            return node
+        if self.peek('exists'):
+            self.next()
+            self.expect('(')
+            key = self.key()
+            self.expect(')')
+            return Exists(key)
+        key = self.key()
+        if self.peek('in'):
+            self.next()
+            self.expect('(')
+            values = [self.value()]
+            while self.peek(','):
+                self.next()
+                values.append(self.value())
+            self.expect(')')
+            return In(key, values)
+        kind, op, _ = self.next()
+        if kind == 'op' and op in ('~', '=~'):
+            return Regex(key, self.value(text=True))
+        if kind == 'op' and op in _COMPARE:
+            return Compare(key, op, self.value())
+        raise AcaiException('Expected an operator after "{}"'.format(key))
+
+    def key(self):
+        kind, value, _ = self.next()
+        if kind not in ('word', 'str'):
+            raise AcaiException('Expected a key, got "{}"'.format(value))
+        return value
+
+    def value(self, text=False):
+        kind, value, source = self.next()
+        if kind == 'op':
+            raise AcaiException('Expected a value, got "{}"'.format(value))
+        return source if text else value
+
+
+def parse(text: str) -> Node:
+    return _Parser(text).parse()
+
+
+class Plan:
+    """One backend query per branch, each with its pushed conditions.
+    Results of several branches are merged by id."""
+
+    def __init__(self, expr: Node, branches: List[List]):
+        self.expr = expr
+        self.branches = branches
+
+    def __str__(self):
+        lines = ['local filter: {}'.format(self.expr)]
+        for i, b in enumerate(self.branches):
+            lines.append('query {}: {}'.format(
+                i + 1, ', '.join(map(repr, b)) or '(all)'))
+        return '\n'.join(lines)
+
+    def execute(self, find_method, constraints: List,
+                page_size: int = DEFAULT_PAGE_SIZE) -> Iterator[List[Dict]]:
+        """Pages of matching records."""
+        seen = set() if len(self.branches) > 1 else None
+        for branch in self.branches:
+            for page in find_pages(find_method, constraints + branch,
+                                   page_size):
+                out = []
+                for r in page:
+                    if not self.expr.matches(r):
+                        continue
+                    if seen is not None:
+                        if r['_id'] in seen:
+                            continue
+                        seen.add(r['_id'])
+                    out.append(r)
+                if out:
+                    yield out
+
+
+def plan(expr: Node) -> Plan:
+    """A top level OR whose branches all narrow the search becomes one
+    query per branch, anything else a single query with the conditions
+    of the top level conjuncts."""
+    if isinstance(expr, Or):
+        branches = [_conjunct_conditions(c) for c in expr.children]
+        if all(branches):
+            return Plan(expr, branches)
+        return Plan(expr, [[]])
+    return Plan(expr, [_conjunct_conditions(expr)])
+
+
+def _conjunct_conditions(node: Node) -> List:
+    if isinstance(node, And):
+        return node.conditions()
+    return And([node]).conditions()
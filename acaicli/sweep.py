@@ -0,0 +1,130 @@
+"""Parameter sweeps for "acai job sweep".
+
+A sweep is a list of parameter dicts, from a grid (``--grid lr=0.1,0.01``,
+the cross product of all grids) and/or a JSON or YAML list of dicts. Each
+parameter dict becomes one job: parameters named like a job attribute
+(e.g. ``gpu``) replace it, and all parameters can be used as ``{name}``
+placeholders in the string attributes, e.g.
+``--command "python train.py --lr {lr}"``. Grid values go into
+placeholders as written, jobs are tagged with them as numbers where they
+are ones.
+"""
+import re
+import json
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from acaisdk.utils.exceptions import AcaiException
+from cliutils import LazyImport
+
+Job = LazyImport('acaisdk.job', 'Job')
+Meta = LazyImport('acaisdk.meta', 'Meta')
+
+
+def _parse_value(v: str):
+    try:
+        return int(v)
+    except ValueError:
+        pass
+    try:
+        return float(v)
+    except ValueError:
+        return v
+
+
+def expand_grid(specs: List[str]) -> List[Dict[str, str]]:
+    """["lr=0.1,0.01", "bs=32,64"] -> the 4 combinations, values as
+    written"""
+    keys, values = [], []
+    for spec in specs:
+        k, sep, vs = spec.partition('=')
+        if not sep or not k:
+            raise AcaiException('Grid should be KEY=V1,V2,..., '
+                                'got "{}"'.format(spec))
+        keys.append(k)
+        values.append(vs.split(','))
+    return [dict(zip(keys, combo)) for combo in itertools.product(*values)]
+
+
+def load_configs(path: str) -> List[Dict]:
+    """A JSON or YAML file with a list of parameter dicts."""
+    with open(path) as f:
+        text = f.read()
+    if path.endswith(('.yaml', '.yml')):
+        try:
+            import yaml
+        except ImportError:
+            raise AcaiException('Reading YAML needs PyYAML: '
+                                'pip install pyyaml')
+        configs = yaml.safe_load(text)
+    else:
+        configs = json.loads(text)
+    if not isinstance(configs, list) \
+            or not all(isinstance(c, dict) for c in configs):
+        raise AcaiException('{} should hold a list of '
+                            'parameter dicts'.format(path))
+    return configs
+
+
+def combine(grid: List[Dict[str, str]], configs: List[Dict]) \
+        -> List[Tuple[Dict, Dict[str, str]]]:
+    """Every config with every grid point. Either one may be empty.
+
+    :return: list of (params, text), where text is what each parameter
+             reads as in placeholders. Grid values keep their text there,
+             "1.10" stays "1.10" even though it is tagged as 1.1.
+    """
+    points = []
+    for c in configs or [{}]:
+        for g in grid or [{}]:
+            params = dict(c, **{k: _parse_value(v) for k, v in g.items()})
+            text = dict({k: str(v) for k, v in c.items()}, **g)
+            points.append((params, text))
+    return points
+
+
+_PLACEHOLDER_RE = re.compile(r'(?<!\$)\{(\w+)\}')
+
+
+def job_attributes(base: Dict, params: Dict, text: Dict[str, str]) -> Dict:
+    """``base`` with the parameters applied. Only ``{name}`` where name is
+    a parameter is replaced, by its ``text``; other braces, as in JSON or
+    ``${VAR}``, are left alone."""
+    attrs = dict(base)
+    for k, v in params.items():
+        if k in attrs:
+            attrs[k] = v
+
+    def substitute(m):
+        name = m.group(1)
+        return text[name] if name in text else m.group(0)
+
+    for k, v in attrs.items():
+        if isinstance(v, str):
+            attrs[k] = _PLACEHOLDER_RE.sub(substitute, v)
+    return attrs
+
+
+def submit(base: Dict, sweep: List[Tuple[Dict, Dict[str, str]]], tags: Dict,
+           parallel: int = 8) -> List[Tuple[Dict, Optional[object],
+                                            Optional[Exception]]]:
+    """Register, tag and start one job per (params, text) of
+    :func:`combine` with at most ``parallel`` submissions in flight. Each
+    job is tagged with its parameters and ``tags``.
+
+    :return: list of (params, job, error) in sweep order
+    """
+    def submit_one(point):
+        params, text = point
+        job = None
+        try:
+            job = Job().with_attributes(
+                job_attributes(base, params, text)).register()
+            Meta.update_job_meta(job.id, [], dict(tags, **params))
+            job.run()
+            return params, job, None
+        except Exception as e:
+            return params, job, e
+
+    with ThreadPoolExecutor(max(1, parallel)) as pool:
+        return list(pool.map(submit_one, sweep))
@@ -0,0 +1,270 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+from typing import Dict, List, Tuple
+from cliutils import CACHE_DIR, LazyImport
+from manifest import hash_file
+from metafetch import get_file_meta
+from transfer import Downloader, Uploader, PARTIAL_SUFFIX, STATE_SUFFIX
+from walk import walk_tree
+
+File = LazyImport('acaisdk.file', 'File')
+
+DEFAULT_PATH = os.path.join(CACHE_DIR, 'sync.sqlite')
+
+
+class SyncPlan:
+    def __init__(self):
+        self.uploads = []  # type: List[str]
+        self.downloads = []  # type: List[str]
+        self.conflicts = []  # type: List[str]
+        # Deleted remotely, removed locally with --delete
+        self.local_deletes = []  # type: List[str]
+        # Deleted locally, the SDK offers no remote delete
+        self.remote_deletes = []  # type: List[str]
+        # Present on both sides with the same size but not in the index
+        # yet, adopted if the contents match
+        self.adopted = []  # type: List[str]
+
+
+class Sync:
+    """Two-way sync between a local directory and a remote directory.
+
+    The index keeps, per relative path, the local size, mtime and sha256
+    and the remote version as of the last sync. A side has changed when
+    its state differs from the index: the local side by size/mtime (and
+    hash when only the mtime moved), the remote side by version. Only the
+    changed paths are transferred; a path changed on both sides is a
+    conflict.
+    """
+
+    def __init__(self, local_root: str, remote_root: str,
+                 index_path: str = DEFAULT_PATH, jobs: int = 8):
+        self.local_root = os.path.abspath(local_root)
+        self.remote_root = remote_root if remote_root.endswith('/') \
+            else remote_root + '/'
+        self.jobs = jobs
+        os.makedirs(os.path.dirname(index_path), exist_ok=True)
+        self.conn = sqlite3.connect(index_path)
+        self.conn.execute('CREATE TABLE IF NOT EXISTS sync_state ('
+                          'local_root TEXT, remote_root TEXT, '
+                          'rel_path TEXT, size INTEGER, mtime_ns INTEGER, '
+                          'sha256 TEXT, remote_version INTEGER, '
+                          'PRIMARY KEY (local_root, remote_root, rel_path))')
+        self.remote = {}  # type: Dict[str, int]
+
+    def _index(self) -> Dict[str, Tuple]:
+        rows = self.conn.execute(
+            'SELECT rel_path, size, mtime_ns, sha256, remote_version '
+            'FROM sync_state WHERE local_root = ? AND remote_root = ?',
+            (self.local_root, self.remote_root))
+        return {r[0]: r[1:] for r in rows}
+
+    def scan_local(self) -> Dict[str, os.stat_result]:
+        files = {}
+        for dir_path, _, names in os.walk(self.local_root):
+            for name in names:
+                if name.endswith(PARTIAL_SUFFIX) \
+                        or name.endswith(STATE_SUFFIX):
+                    continue
+                full = os.path.join(dir_path, name)
+                rel = os.path.relpath(full, self.local_root)
+                files[rel.replace(os.sep, '/')] = os.stat(full)
+        return files
+
+    def scan_remote(self) -> Dict[str, int]:
+        """rel path -> latest remote version. Fails if any directory
+        cannot be listed: its files would look deleted remotely."""
+        files = {}
+        for directory, entries in walk_tree(self.remote_root,
+                                            parallel=self.jobs, strict=True):
+            for e in entries:
+                if not e['is_dir']:
+                    rel = os.path.join(directory, e['path'])[
+                        len(self.remote_root):]
+                    files[rel] = int(e['version'])
+        return files
+
+    def plan(self, prefer: str = None, delete: bool = False) -> SyncPlan:
+        """:param prefer: "local" or "remote" to resolve conflicts."""
+        plan = SyncPlan()
+        index = self._index()
+        local = self.scan_local()
+        self.remote = remote = self.scan_remote()
+        unindexed_both = []
+
+        for rel in sorted(local.keys() | remote.keys() | index.keys()):
+            st, version, state = local.get(rel), remote.get(rel), \
+                index.get(rel)
+            if state is None:
+                if st and version is None:
+                    plan.uploads.append(rel)
+                elif version is not None and not st:
+                    plan.downloads.append(rel)
+                elif st and version is not None:
+                    unindexed_both.append(rel)
+                continue
+
+            local_changed = st is None or self._local_changed(rel, st, state)
+            remote_changed = version != state[3]
+            if st is None and version is None:
+                self._forget(rel)
+            elif st is None:
+                # Deleted locally
+                if remote_changed:
+                    plan.downloads.append(rel)
+                elif delete:
+                    plan.remote_deletes.append(rel)
+                else:
+                    plan.downloads.append(rel)
+            elif version is None:
+                # Deleted remotely
+                if local_changed:
+                    plan.uploads.append(rel)
+                elif delete:
+                    plan.local_deletes.append(rel)
+                else:
+                    plan.uploads.append(rel)
+            elif local_changed and remote_changed:
+                self._resolve(plan, rel, prefer)
+            elif local_changed:
+                plan.uploads.append(rel)
+            elif remote_changed:
+                plan.downloads.append(rel)
+
+        # Both sides have a file the index does not know about. Unless a
+        # side is preferred, files of the same size are compared by
+        # content in execute(), others are conflicts.
+        if unindexed_both:
+            metas = get_file_meta(self._remote_path(rel)
+                                  for rel in unindexed_both)
+            for rel in unindexed_both:
+                meta = metas.get(self._remote_path(rel), {})
+                if prefer is None and \
+                        int(meta.get('__size__', -1)) == local[rel].st_size:
+                    plan.adopted.append(rel)
+                else:
+                    self._resolve(plan, rel, prefer)
+        self.conn.commit()
+        return plan
+
+    def _local_changed(self, rel, st, state) -> bool:
+        size, mtime_ns, sha256, _ = state
+        if st.st_size != size:
+            return True
+        if st.st_mtime_ns == mtime_ns:
+            return False
+        digest = hash_file(self._local_path(rel))
+        if digest != sha256:
+            return True
+        self.conn.execute(
+            'UPDATE sync_state SET mtime_ns = ? WHERE local_root = ? '
+            'AND remote_root = ? AND rel_path = ?',
+            (st.st_mtime_ns, self.local_root, self.remote_root, rel))
+        return False
+
+    @staticmethod
+    def _resolve(plan, rel, prefer):
+        if prefer == 'local':
+            plan.uploads.append(rel)
+        elif prefer == 'remote':
+            plan.downloads.append(rel)
+        else:
+            plan.conflicts.append(rel)
+
+    def execute(self, plan: SyncPlan) -> List[Tuple[str, Exception]]:
+        """Transfer and record the plan. :return: failed (path, error)"""
+        failed = []
+
+        downloader = Downloader(jobs=self.jobs, force=True)
+        results = downloader.download(
+            [(self._remote_path(rel), self._local_path(rel))
+             for rel in plan.downloads])
+        for (_, _, error), rel in zip(results, plan.downloads):
+            if error:
+                failed.append((rel, error))
+            else:
+                self._record(rel, self.remote[rel])
+
+        if plan.uploads:
+            result = Uploader(jobs=self.jobs).upload(
+                [(self._local_path(rel), self.remote_root + rel)
+                 for rel in plan.uploads])
+            uploaded = [r[len(self.remote_root):] for _, r in result.uploaded]
+            versions = self._remote_versions(uploaded)
+            for rel in uploaded:
+                self._record(rel, versions.get(rel))
+            failed += [(l, e) for l, _, e in result.failed]
+
+        failed += self._adopt(plan)
+
+        for rel in plan.local_deletes:
+            os.remove(self._local_path(rel))
+            self._forget(rel)
+
+        self.conn.commit()
+        return failed
+
+    def _adopt(self, plan: SyncPlan) -> List[Tuple[str, Exception]]:
+        """Fetch the adoption candidates and record those identical to
+        the local file. The others become conflicts."""
+        if not plan.adopted:
+            return []
+        tmp_dir = tempfile.mkdtemp(prefix='acai-sync-')
+        try:
+            tmp = {rel: os.path.join(tmp_dir, str(i))
+                   for i, rel in enumerate(plan.adopted)}
+            results = Downloader(jobs=self.jobs, force=True).download(
+                [(self._remote_path(rel), tmp[rel]) for rel in plan.adopted])
+            failed, adopted = [], []
+            for (_, _, error), rel in zip(results, plan.adopted):
+                if error:
+                    failed.append((rel, error))
+                    continue
+                digest = hash_file(tmp[rel])
+                if digest == hash_file(self._local_path(rel)):
+                    self._record(rel, self.remote[rel], sha256=digest)
+                    adopted.append(rel)
+                else:
+                    plan.conflicts.append(rel)
+            plan.adopted = adopted
+            return failed
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def _remote_versions(self, rels: List[str]) -> Dict[str, int]:
+        """Latest versions after uploading, by listing their directories."""
+        versions = {}
+        dirs = {os.path.dirname(self.remote_root + rel) for rel in rels}
+        for d in dirs:
+            for e in File.list_dir(d):
+                if not e['is_dir']:
+                    rel = os.path.join(d, e['path'])[len(self.remote_root):]
+                    versions[rel] = int(e['version'])
+        return versions
+
+    def _record(self, rel, version, sha256: str = None):
+        path = self._local_path(rel)
+        st = os.stat(path)
+        self.conn.execute(
+            'INSERT OR REPLACE INTO sync_state VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (self.local_root, self.remote_root, rel, st.st_size,
+             st.st_mtime_ns, sha256 or hash_file(path), version))
+
+    def _forget(self, rel):
+        self.conn.execute(
+            'DELETE FROM sync_state WHERE local_root = ? '
+            'AND remote_root = ? AND rel_path = ?',
+            (self.local_root, self.remote_root, rel))
+
+    def _local_path(self, rel):
+        return os.path.join(self.local_root, *rel.split('/'))
+
+    def _remote_path(self, rel):
+        """Versioned remote path as of the scan."""
+        return '{}{}:{}'.format(self.remote_root, rel, self.remote[rel])
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
@@ -0,0 +1,190 @@
+"""Timing of CLI phases and SDK calls, for "--trace FILE" and "--profile".
+
+Nothing is recorded unless :func:`start` was called: :func:`span` then
+returns a shared no-op context manager and :func:`add` returns right
+away, so the hooks can stay in hot paths. When enabled, the SDK classes
+and the output layer are wrapped so that every call becomes a span, and
+transfer code adds byte and retry counts.
+
+The trace is written in the Chrome trace event format, to be opened in
+chrome://tracing or https://ui.perfetto.dev.
+"""
+import os
+import sys
+import json
+import time
+import atexit
+import types
+import functools
+import importlib
+import threading
+from typing import Dict, List
+
+enabled = False
+_events = []  # type: List[Dict]
+_counters = {}  # type: Dict[str, float]
+_lock = threading.Lock()
+_trace_path = None
+_profiler = None
+
+# Classes whose methods are traced, as (module, class, category)
+INSTRUMENTED = [
+    ('acaisdk.file', 'File', 'sdk'),
+    ('acaisdk.fileset', 'FileSet', 'sdk'),
+    ('acaisdk.meta', 'Meta', 'sdk'),
+    ('acaisdk.job', 'Job', 'sdk'),
+    ('acaisdk.project', 'Project', 'sdk'),
+    ('acaisdk.utils.rest_utils', 'RestRequest', 'sdk'),
+    ('prettyprint', 'PrettyPrint', 'render'),
+    ('formatters', 'Formatter', 'render'),
+]
+
+
+def now_us() -> float:
+    return time.perf_counter() * 1e6
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    def __init__(self, name, cat, args):
+        self.name = name
+        self.cat = cat
+        self.args = args
+
+    def __enter__(self):
+        self.start = now_us()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.args['error'] = exc_type.__name__
+        record(self.name, self.cat, self.start, now_us() - self.start,
+               self.args)
+        return False
+
+
+def span(name: str, cat: str = 'phase', **args):
+    """Context manager timing a block."""
+    if not enabled:
+        return _NULL_SPAN
+    return _Span(name, cat, args)
+
+
+def record(name: str, cat: str, start_us: float, dur_us: float,
+           args: Dict = None) -> None:
+    """Add a finished span, e.g. one that started before tracing did."""
+    if not enabled:
+        return
+    event = {'name': name, 'cat': cat, 'ph': 'X', 'ts': start_us,
+             'dur': dur_us, 'pid': os.getpid(),
+             'tid': threading.get_ident()}
+    if args:
+        event['args'] = args
+    _events.append(event)
+
+
+def add(counter: str, value: float = 1) -> None:
+    """Add to a counter, e.g. bytes transferred or retries."""
+    if not enabled:
+        return
+    with _lock:
+        total = _counters[counter] = _counters.get(counter, 0) + value
+        _events.append({'name': counter, 'ph': 'C', 'ts': now_us(),
+                        'pid': os.getpid(), 'args': {counter: total}})
+
+
+def traced(name: str, cat: str = 'phase'):
+    """Decorator form of :func:`span`."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return fn(*args, **kwargs)
+            with _Span(name, cat, {}):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _instrument(cls, cat: str) -> None:
+    for attr, value in list(vars(cls).items()):
+        if attr.startswith('__'):
+            continue
+        name = '{}.{}'.format(cls.__name__, attr)
+        if isinstance(value, staticmethod):
+            setattr(cls, attr, staticmethod(
+                traced(name, cat)(value.__func__)))
+        elif isinstance(value, classmethod):
+            setattr(cls, attr, classmethod(
+                traced(name, cat)(value.__func__)))
+        elif isinstance(value, types.FunctionType):
+            setattr(cls, attr, traced(name, cat)(value))
+
+
+def start(trace_path: str = None, profile: bool = False) -> None:
+    """Turn on recording. Results are written when the process exits."""
+    global enabled, _trace_path, _profiler
+    if enabled:
+        return
+    enabled = True
+    _trace_path = trace_path
+    with span('instrument'):
+        for module, cls, cat in INSTRUMENTED:
+            try:
+                _instrument(getattr(importlib.import_module(module), cls),
+                            cat)
+            except (ImportError, AttributeError):
+                pass
+    atexit.register(finish)
+    if profile:
+        import cProfile
+        _profiler = cProfile.Profile()
+        _profiler.enable()
+
+
+def summary() -> List[List]:
+    """[name, category, calls, total ms] per span name, slowest first."""
+    totals = {}
+    for e in _events:
+        if e['ph'] == 'X':
+            t = totals.setdefault((e['name'], e['cat']), [0, 0.0])
+            t[0] += 1
+            t[1] += e['dur'] / 1000
+    return sorted([[n, c, calls, ms] for (n, c), (calls, ms)
+                   in totals.items()], key=lambda r: -r[3])
+
+
+def finish() -> None:
+    global enabled
+    if not enabled:
+        return
+    enabled = False
+    out = sys.stderr
+    if _profiler:
+        import pstats
+        _profiler.disable()
+        pstats.Stats(_profiler, stream=out) \
+            .sort_stats('cumulative').print_stats(30)
+    out.write('{:<40} {:<8} {:>7} {:>10}\n'.format(
+        'span', 'category', 'calls', 'total ms'))
+    for name, cat, calls, ms in summary():
+        out.write('{:<40} {:<8} {:>7} {:>10.1f}\n'.format(
+            name, cat, calls, ms))
+    for counter, total in sorted(_counters.items()):
+        out.write('{:<40} {:<8} {:>18}\n'.format(counter, 'counter',
+                                                 int(total)))
+    if _trace_path:
+        with open(_trace_path, 'w') as f:
+            json.dump({'traceEvents': _events,
+                       'displayTimeUnit': 'ms'}, f)
+        out.write('Trace written to {}\n'.format(_trace_path))
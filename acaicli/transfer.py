@@ -0,0 +1,389 @@
+import os
+import json
+import time
+import threading
+import urllib.request
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import List, Tuple, Callable, Optional, Iterable
+import tracing
+
+DEFAULT_JOBS = 8
+# Small files are packed into batches of at most this many files / bytes,
+# each batch is one File.upload call.
+DEFAULT_BATCH_FILES = 64
+DEFAULT_BATCH_BYTES = 16 * 1024 * 1024
+# Objects larger than this are fetched as several parallel range requests.
+DEFAULT_CHUNK_SIZE = 16 * 1024 * 1024
+PARTIAL_SUFFIX = '.acaipart'
+STATE_SUFFIX = '.acaipart.json'
+_BUF_SIZE = 1024 * 1024
+
+
+def resolve_download_url(remote_path: str) -> str:
+    """Ask the storage service for a presigned URL of a remote file.
+
+    This is the only place the download engine talks to the ACAI backend,
+    everything else is plain HTTP, so a local stand-in server can be used
+    by passing another resolver to :class:`Downloader`.
+    """
+    from acaisdk.services.api_calls import StorageApi
+    from acaisdk.utils.rest_utils import RestRequest
+    r = RestRequest(StorageApi.download_file) \
+        .with_query({'path': remote_path}) \
+        .with_credentials() \
+        .run()
+    return r['s3_url']
+
+
+def strip_version(remote_path: str) -> str:
+    """"/a/b.txt:3" -> "/a/b.txt" """
+    head, sep, tail = remote_path.rpartition(':')
+    if sep and tail.isdigit() and '/' not in tail:
+        return head
+    return remote_path
+
+
+class TransferError(Exception):
+    pass
+
+
+class Downloader:
+    """Downloads many remote files at once.
+
+    Files are handed out to a pool of ``jobs`` workers. Files larger than
+    ``chunk_size`` are split into range requests which run on a second
+    pool of the same size, so a single huge object does not serialize the
+    run.
+
+    Data is written to ``<local>.acaipart`` and renamed on completion.
+    Next to it, ``<local>.acaipart.json`` records the remote path, size
+    and ETag of the object and, for chunked files, the finished chunks.
+    An interrupted run picks up from there, but only if the object is
+    still the same; resumed requests also carry ``If-Range``.
+    """
+
+    def __init__(self,
+                 url_resolver: Callable[[str], str] = resolve_download_url,
+                 jobs: int = DEFAULT_JOBS,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 retries: int = 3,
+                 force: bool = False):
+        self.url_resolver = url_resolver
+        self.jobs = max(1, jobs)
+        self.chunk_size = chunk_size
+        self.retries = retries
+        self.force = force
+        self.bytes_downloaded = 0
+        self._lock = threading.Lock()
+
+    def download(self, remote_to_local: List[Tuple[str, str]]) \
+            -> List[Tuple[str, str, Optional[Exception]]]:
+        """
+        :param remote_to_local: list of (remote path, local path)
+        :return: list of (remote path, local path, error or None)
+        """
+        with ThreadPoolExecutor(self.jobs) as file_pool, \
+                ThreadPoolExecutor(self.jobs) as chunk_pool:
+            futures = [(r, l, file_pool.submit(self._download_one,
+                                               r, l, chunk_pool))
+                       for r, l in remote_to_local]
+            results = []
+            for r, l, f in futures:
+                try:
+                    f.result()
+                    results.append((r, l, None))
+                except Exception as e:
+                    results.append((r, l, e))
+        return results
+
+    def _download_one(self, remote_path, local_path, chunk_pool):
+        if os.path.exists(local_path) and not self.force:
+            return
+        with tracing.span('download', 'transfer', path=remote_path):
+            self._download_file(remote_path, local_path, chunk_pool)
+
+    def _download_file(self, remote_path, local_path, chunk_pool):
+        local_dir = os.path.dirname(local_path)
+        if local_dir:
+            os.makedirs(local_dir, exist_ok=True)
+        url = self.url_resolver(remote_path)
+        part_path = local_path + PARTIAL_SUFFIX
+        state_path = local_path + STATE_SUFFIX
+        size, validator = self._probe(url)
+        identity = {'remote': remote_path, 'size': size,
+                    'validator': validator}
+        state = self._load_state(state_path, identity)
+        if state is None and os.path.exists(part_path):
+            # Left by another object, or by a run that could not tell
+            os.remove(part_path)
+
+        if size is not None and size > self.chunk_size:
+            self._download_chunked(url, part_path, state_path, identity,
+                                   state, chunk_pool)
+        else:
+            if state and state.get('chunk_size') is not None \
+                    and os.path.exists(part_path):
+                # Preallocated by a chunked download, not a prefix
+                os.remove(part_path)
+            self._download_stream(url, part_path, state_path, identity)
+        os.replace(part_path, local_path)
+        if os.path.exists(state_path):
+            os.remove(state_path)
+
+    def _download_stream(self, url, part_path, state_path, identity):
+        """Single request download, resuming from the partial file if it
+        belongs to the same object."""
+        size, validator = identity['size'], identity['validator']
+        # Only a partial of a known object can be resumed
+        resumable = size is not None and validator is not None
+        if resumable:
+            self._save_state(state_path, identity)
+        for attempt in range(self.retries + 1):
+            offset = os.path.getsize(part_path) \
+                if resumable and os.path.exists(part_path) else 0
+            headers = {}
+            if offset:
+                headers = {'Range': 'bytes={}-'.format(offset),
+                           'If-Range': validator}
+            try:
+                with self._open(url, headers) as resp:
+                    if offset and resp.status != 206:
+                        # Server ignored the range or the object changed,
+                        # start over.
+                        offset = 0
+                    mode = 'ab' if offset else 'wb'
+                    with open(part_path, mode) as f:
+                        self._copy(resp, f)
+                if size is None or os.path.getsize(part_path) == size:
+                    return
+                os.remove(part_path)
+                error = 'expected {} bytes'.format(size)
+            except urllib.error.HTTPError as e:
+                if e.code == 416 and offset == size:
+                    # Partial file is already complete.
+                    return
+                if e.code == 416 and os.path.exists(part_path):
+                    os.remove(part_path)
+                error = e
+            except OSError as e:
+                error = e
+            if attempt == self.retries:
+                raise TransferError('{}: {}'.format(url, error))
+            tracing.add('download_retries')
+
+    def _download_chunked(self, url, part_path, state_path, identity,
+                          state, chunk_pool):
+        size = identity['size']
+        n_chunks = (size + self.chunk_size - 1) // self.chunk_size
+        done = set()
+        if state and state.get('chunk_size') == self.chunk_size \
+                and os.path.exists(part_path) \
+                and os.path.getsize(part_path) == size:
+            done = set(state['done'])
+        else:
+            with open(part_path, 'wb') as f:
+                f.truncate(size)
+            self._save_state(state_path, identity, done)
+
+        state_lock = threading.Lock()
+
+        def fetch(idx):
+            start = idx * self.chunk_size
+            end = min(size, start + self.chunk_size) - 1
+            self._fetch_range(url, part_path, start, end,
+                              identity['validator'])
+            with state_lock:
+                done.add(idx)
+                self._save_state(state_path, identity, done)
+
+        futures = [chunk_pool.submit(fetch, i)
+                   for i in range(n_chunks) if i not in done]
+        for f in futures:
+            f.result()
+
+    def _fetch_range(self, url, part_path, start, end, validator):
+        headers = {'Range': 'bytes={}-{}'.format(start, end)}
+        if validator:
+            headers['If-Range'] = validator
+        for attempt in range(self.retries + 1):
+            try:
+                with self._open(url, headers) as resp, \
+                        open(part_path, 'r+b') as f:
+                    if resp.status != 206:
+                        raise TransferError(
+                            '{}: object changed or range requests not '
+                            'supported'.format(url))
+                    f.seek(start)
+                    n = self._copy(resp, f)
+                if n != end - start + 1:
+                    raise TransferError(
+                        '{}: short read at byte {}'.format(url, start))
+                return
+            except (OSError, TransferError) as e:
+                if attempt == self.retries:
+                    raise TransferError('{}: {}'.format(url, e))
+            tracing.add('download_retries')
+
+    def _probe(self, url) -> Tuple[Optional[int], Optional[str]]:
+        """Total object size and its ETag (or Last-Modified), from a one
+        byte range request.
+
+        Presigned URLs are only valid for GET, so HEAD is not an option.
+        """
+        try:
+            with self._open(url, {'Range': 'bytes=0-0'}) as resp:
+                validator = resp.headers.get('ETag') \
+                    or resp.headers.get('Last-Modified')
+                content_range = resp.headers.get('Content-Range')
+                if resp.status == 206 and content_range:
+                    return int(content_range.rsplit('/', 1)[1]), validator
+                length = resp.headers.get('Content-Length')
+                return (int(length) if length else None), validator
+        except (OSError, ValueError):
+            pass
+        return None, None
+
+    def _copy(self, src, dst) -> int:
+        n = 0
+        while True:
+            buf = src.read(_BUF_SIZE)
+            if not buf:
+                break
+            dst.write(buf)
+            n += len(buf)
+        with self._lock:
+            self.bytes_downloaded += n
+        tracing.add('bytes_downloaded', n)
+        return n
+
+    @staticmethod
+    def _open(url, headers):
+        return urllib.request.urlopen(
+            urllib.request.Request(url, headers=headers))
+
+    @staticmethod
+    def _load_state(state_path, identity) -> Optional[dict]:
+        """The saved state if it was written for the same remote object
+        (path, size and ETag), otherwise None."""
+        try:
+            with open(state_path) as f:
+                state = json.load(f)
+            if all(state.get(k) == v for k, v in identity.items()) \
+                    and identity['size'] is not None:
+                return state
+        except (OSError, ValueError):
+            pass
+        return None
+
+    def _save_state(self, state_path, identity, done=None):
+        """:param done: finished chunks, None for a streamed download"""
+        tmp = state_path + '.tmp'
+        chunk_size = self.chunk_size if done is not None else None
+        with open(tmp, 'w') as f:
+            json.dump(dict(identity,
+                           chunk_size=chunk_size,
+                           done=sorted(done or ())), f)
+        os.replace(tmp, state_path)
+
+
+class UploadResult:
+    """Aggregated outcome of an :class:`Uploader` run."""
+
+    def __init__(self):
+        self.sdk_results = []
+        self.uploaded = []  # type: List[Tuple[str, str]]
+        self.failed = []  # type: List[Tuple[str, str, Exception]]
+        # Unchanged files left out of the upload, still part of the result
+        self.skipped = []  # type: List[Tuple[str, str]]
+        self.bytes_uploaded = 0
+        self.elapsed = 0.0
+
+    @property
+    def throughput(self) -> float:
+        """Bytes per second."""
+        return self.bytes_uploaded / self.elapsed if self.elapsed else 0.0
+
+    def as_new_file_set(self, file_set: str):
+        if len(self.sdk_results) == 1 and not self.failed \
+                and not self.skipped:
+            return self.sdk_results[0].as_new_file_set(file_set)
+        from acaisdk.fileset import FileSet
+        return FileSet.create_file_set(
+            file_set, [r for _, r in self.uploaded + self.skipped])
+
+
+class Uploader:
+    """Uploads (local, remote) pairs with bounded concurrency.
+
+    Small files are packed into batches so that a directory of many tiny
+    files does not pay one round-trip per file, files of at least
+    ``batch_bytes`` are uploaded on their own. At most ``jobs`` batches are
+    in flight and at most ``2 * jobs`` are queued, so the input can be a
+    lazy iterable of any length.
+    """
+
+    def __init__(self,
+                 upload_fn: Callable = None,
+                 jobs: int = DEFAULT_JOBS,
+                 batch_files: int = DEFAULT_BATCH_FILES,
+                 batch_bytes: int = DEFAULT_BATCH_BYTES):
+        if upload_fn is None:
+            from acaisdk.file import File
+            upload_fn = File.upload
+        self.upload_fn = upload_fn
+        self.jobs = max(1, jobs)
+        self.batch_files = batch_files
+        self.batch_bytes = batch_bytes
+
+    def upload(self, l_r_mapping: Iterable[Tuple[str, str]]) -> UploadResult:
+        result = UploadResult()
+        start = time.time()
+        with ThreadPoolExecutor(self.jobs) as pool:
+            pending = set()
+            for batch in self._batches(l_r_mapping):
+                if len(pending) >= 2 * self.jobs:
+                    done, pending = wait(pending,
+                                         return_when=FIRST_COMPLETED)
+                    self._collect(done, result)
+                pending.add(pool.submit(self._upload_batch, batch))
+            self._collect(wait(pending)[0], result)
+        result.elapsed = time.time() - start
+        return result
+
+    def _batches(self, l_r_mapping):
+        batch, batch_size = [], 0
+        for l, r in l_r_mapping:
+            size = os.path.getsize(l)
+            if size >= self.batch_bytes:
+                yield [(l, r, size)]
+                continue
+            batch.append((l, r, size))
+            batch_size += size
+            if len(batch) >= self.batch_files \
+                    or batch_size >= self.batch_bytes:
+                yield batch
+                batch, batch_size = [], 0
+        if batch:
+            yield batch
+
+    def _upload_batch(self, batch):
+        try:
+            with tracing.span('upload', 'transfer', files=len(batch)):
+                r = self.upload_fn([(l, r) for l, r, _ in batch])
+            tracing.add('bytes_uploaded',
+                        sum(size for _, _, size in batch))
+            return batch, r, None
+        except Exception as e:
+            return batch, None, e
+
+    @staticmethod
+    def _collect(futures, result: UploadResult):
+        for f in futures:
+            batch, sdk_result, error = f.result()
+            if error:
+                result.failed.extend((l, r, error) for l, r, _ in batch)
+                continue
+            result.sdk_results.append(sdk_result)
+            result.uploaded.extend((l, r) for l, r, _ in batch)
+            result.bytes_uploaded += sum(size for _, _, size in batch)
@@ -0,0 +1,58 @@
+import os
+from typing import Callable, Dict, Iterator, List, Tuple
+from cliutils import LazyImport, print_warn
+from concurrency import ordered_map, DEFAULT_PARALLEL
+
+File = LazyImport('acaisdk.file', 'File')
+
+
+def walk_files(remote_dir: str, prefix: str = '') \
+        -> Iterator[Tuple[str, str]]:
+    """Yield (versioned remote path, path relative to remote_dir)
+    for every file under remote_dir.
+    """
+    for d in File.list_dir(remote_dir):
+        remote_path = os.path.join(remote_dir, d['path'])
+        rel_path = os.path.join(prefix, d['path'])
+        if d['is_dir']:
+            yield from walk_files(remote_path + '/', rel_path)
+        else:
+            yield '{}:{}'.format(remote_path, d['version']), rel_path
+
+
+def walk_tree(root: str, max_depth: int = None,
+              parallel: int = DEFAULT_PARALLEL,
+              list_dir: Callable = None, strict: bool = False) \
+        -> Iterator[Tuple[str, List[Dict]]]:
+    """Breadth-first walk of a remote directory tree.
+
+    Yields (directory, File.list_dir entries) for ``root`` and every
+    directory below it, down to ``max_depth`` levels under the root. The
+    directories of one level are listed concurrently, up to ``parallel``
+    at a time, and come out in a stable order. Directories that cannot
+    be listed are reported and skipped, or with ``strict`` end the walk
+    with the listing error, for callers that would take a missing
+    listing for deleted files.
+    """
+    list_dir = list_dir or File.list_dir
+
+    def list_one(directory):
+        try:
+            return directory, list_dir(directory)
+        except Exception as e:
+            if strict:
+                raise
+            print_warn('Cannot list {}: {}'.format(directory, e))
+            return directory, []
+
+    level = [root if root.endswith('/') else root + '/']
+    depth = 0
+    while level:
+        next_level = []
+        for directory, entries in ordered_map(list_one, level, parallel):
+            yield directory, entries
+            if max_depth is None or depth < max_depth:
+                next_level += [os.path.join(directory, e['path']) + '/'
+                               for e in entries if e['is_dir']]
+        level = next_level
+        depth += 1
@@ -0,0 +1,93 @@
+"""Memory of "find" output against a stand-in backend.
+
+The stand-in find method returns N records in one response, like the
+real API. The response itself is allocated before measuring; what is
+reported is the peak memory on top of it while the results are printed,
+either all at once (the old single pprint) or streamed page by page
+through find_pages and a formatter. Streaming should stay flat as N
+grows.
+
+    python benchmarks/find_pages.py [--sizes 10000 100000 1000000]
+                                    [--max_all 100000]
+"""
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+from pprint import pprint
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'acaicli'))
+
+from metaquery import find_pages, records  # noqa: E402
+from formatters import get_formatter  # noqa: E402
+
+
+def stand_in_backend(n):
+    data = [{'_id': '/data/part-{:08d}.bin:1'.format(i),
+             '__size__': i * 4096,
+             '__creator_id__': i % 7,
+             '__create_time__': 1600000000000 + i,
+             'eval_loss': i / n}
+            for i in range(n)]
+    return lambda *constraints: {'data': data}
+
+
+def print_all(find, out):
+    pprint(find()['data'], stream=out)
+
+
+def print_streamed(find, out, page_size=1000):
+    get_formatter('ndjson', out).write_all(
+        records(find_pages(find, [], page_size)))
+
+
+def measure(fn, n, out):
+    """(peak bytes on top of the response, seconds). Timed in a separate
+    run, tracemalloc slows allocations down a lot."""
+    find = stand_in_backend(n)
+    start = time.perf_counter()
+    fn(find, out)
+    elapsed = time.perf_counter() - start
+
+    find = stand_in_backend(n)
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    fn(find, out)
+    peak = tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+    return peak, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[10000, 100000, 1000000])
+    parser.add_argument('--max_all', type=int, default=100000,
+                        help='only print all at once up to this many '
+                             'records, it is slow')
+    args = parser.parse_args()
+
+    print('{:>10}  {:>20}  {:>20}'.format('records', 'all at once',
+                                           'streamed'))
+    cell = '{:>9.1f} MB {:>6.2f} s'
+    streamed = []
+    with open(os.devnull, 'w') as out:
+        for n in args.sizes:
+            old = '-'
+            if n <= args.max_all:
+                peak, elapsed = measure(print_all, n, out)
+                old = cell.format(peak / 2 ** 20, elapsed)
+            peak, elapsed = measure(print_streamed, n, out)
+            streamed.append(peak)
+            print('{:>10}  {:>20}  {:>20}'.format(
+                n, old, cell.format(peak / 2 ** 20, elapsed)))
+    # Bounded: the largest result set may not need much more than the
+    # smallest one
+    assert streamed[-1] <= 2 * streamed[0] + 2 ** 20, \
+        'streaming memory grows with the result size'
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""Import time guard for the "acai" startup path.
+
+Runs ``python -X importtime`` on what every command imports (main, the
+argument parser and the commands module) and fails when the CLI's own
+share, i.e. everything but the acaisdk subtrees, exceeds the budget or
+when one of the modules only some commands need is imported eagerly.
+
+    python benchmarks/import_time.py [--budget_ms 50] [--runs 5]
+"""
+import os
+import sys
+import argparse
+import subprocess
+
+CLI_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                       '..', 'acaicli')
+STARTUP = 'import main, commands'
+# Must not be imported by CLI modules on the startup path
+LAZY = ['tempfile', 'concurrent.futures', 'inspect', 'ast', 'extsort',
+        'sweep', 'pprint', 'sqlite3', 'transfer', 'manifest', 'sync',
+        'blobstore', 'jobwatch']
+
+
+def import_tree(python=sys.executable):
+    """[(module, depth, self us, cumulative us, parent index)] in the
+    order -X importtime prints them: children before their parent."""
+    out = subprocess.run(
+        [python, '-X', 'importtime', '-c', STARTUP], cwd=CLI_DIR,
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        universal_newlines=True, check=True).stderr
+    rows = []
+    for line in out.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cum_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append([name.strip(), depth, int(self_us), int(cum_us), None])
+    for i, row in enumerate(rows):
+        for j in range(i + 1, len(rows)):
+            if rows[j][1] < row[1]:
+                row[4] = j
+                break
+    return rows
+
+
+def ancestors(rows, i):
+    while rows[i][4] is not None:
+        i = rows[i][4]
+        yield rows[i][0]
+
+
+def cli_time_us(rows, cli_modules) -> int:
+    """Import time of the top level CLI modules without the acaisdk
+    subtrees below them."""
+    total = sum(r[3] for r in rows if r[4] is None and r[0] in cli_modules)
+    for i, r in enumerate(rows):
+        if r[0].startswith('acaisdk') and not any(
+                a.startswith('acaisdk') for a in ancestors(rows, i)):
+            total -= r[3]
+    return total
+
+
+def eager_imports(rows, cli_modules):
+    """(module, import chain) of LAZY modules imported by CLI modules."""
+    found = []
+    for i, r in enumerate(rows):
+        if r[0] not in LAZY:
+            continue
+        chain = list(ancestors(rows, i))
+        # The closest importer that is either the CLI or the SDK
+        owner = next((a for a in chain if a in cli_modules
+                      or a.startswith('acaisdk')), None)
+        if owner in cli_modules or not chain and r[0] in cli_modules:
+            found.append((r[0], ' <- '.join(chain) or '(top level)'))
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--budget_ms', type=float, default=50.0)
+    parser.add_argument('--runs', type=int, default=5,
+                        help='the fastest run counts')
+    args = parser.parse_args()
+
+    cli_modules = {f[:-3] for f in os.listdir(CLI_DIR) if f.endswith('.py')}
+    runs = [import_tree() for _ in range(max(1, args.runs))]
+    best = min(runs, key=lambda rows: cli_time_us(rows, cli_modules))
+    ms = cli_time_us(best, cli_modules) / 1000
+    print('CLI import time: {:.1f} ms (budget {:.1f} ms, best of {})'
+          .format(ms, args.budget_ms, len(runs)))
+    slowest = sorted((r for r in best if r[3] >= 500), key=lambda r: -r[3])
+    for name, depth, _, cum_us, _ in slowest[:15]:
+        print('  {:>8.1f} ms  {}{}'.format(cum_us / 1000, '  ' * depth,
+                                             name))
+
+    eager = eager_imports(best, cli_modules)
+    for name, chain in eager:
+        print('Imported eagerly: {} <- {}'.format(name, chain))
+    assert not eager, 'modules that should be lazy were imported'
+    assert ms <= args.budget_ms, 'import time over budget'
+
+
+if __name__ == '__main__':
+    main()
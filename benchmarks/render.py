@@ -0,0 +1,116 @@
+"""Rendering of "ls -l" tables: the columnar MetaTable against the
+original row-by-row renderer.
+
+Every case runs in its own process with stdout going to /dev/null and
+reports wall time and peak RSS. Rows are generated in batches of
+``--batch`` files, as ls fetches their metadata; the original renderer
+needs all of them at once.
+
+    python benchmarks/render.py [--rows 10000 1000000 10000000]
+                                [--max_old 1000000]
+"""
+import os
+import sys
+import time
+import argparse
+import resource
+import subprocess
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'acaicli'))
+
+
+def batches(rows, batch):
+    for start in range(0, rows, batch):
+        ids = ['/data/part-{:08d}.bin:1'.format(i)
+               for i in range(start, min(rows, start + batch))]
+        metas = [{'_id': fid,
+                  '__size__': (i * 7919) % (1 << 34),
+                  '__creator_id__': i % 7,
+                  '__create_time__': 1600000000000 + i * 1000}
+                 for i, fid in enumerate(ids, start)]
+        yield ids, metas
+
+
+def render_old(rows, batch):
+    """The renderer before MetaTable: one list of strings per row, a
+    datetime per row, two passes over all rows."""
+    from acaisdk.utils.utils import bytes_to_size
+    file_ids, files_meta = [], []
+    for ids, metas in batches(rows, batch):
+        file_ids += ids
+        files_meta += metas
+    id_to_meta = {d['_id']: d for d in files_meta}
+    cols = [['[/]', 'size', 'user', 'created']]
+    for fid in file_ids:
+        if fid in id_to_meta:
+            size = bytes_to_size(int(str(id_to_meta[fid]['__size__'])))
+            uid = str(id_to_meta[fid]['__creator_id__'])
+            created_at = id_to_meta[fid]['__create_time__'] // 1000
+            ts = datetime.utcfromtimestamp(created_at) \
+                .strftime('%Y-%m-%d %H:%M:%S')
+            cols.append([fid, size, uid, ts])
+        else:
+            cols.append([fid, '-', '-', '-'])
+    max_col_width = [0, 0, 0, 0]
+    for row in cols:
+        for i, c in enumerate(row):
+            max_col_width[i] = max(max_col_width[i], len(c))
+    template = '  '.join(['{{:{}}}', '{{:>{}}}', '{{:>{}}}', '{{:>{}}}'][i]
+                         .format(w) for i, w in enumerate(max_col_width))
+    for r in cols:
+        print(template.format(*r))
+
+
+def render_new(rows, batch):
+    from prettyprint import PrettyPrint
+    PrettyPrint.list_with_meta_batches(None, batches(rows, batch))
+
+
+def run_one(renderer, rows, batch):
+    """Child process: render to /dev/null, print seconds and peak KB."""
+    sys.stdout = open(os.devnull, 'w')
+    start = time.perf_counter()
+    {'old': render_old, 'new': render_new}[renderer](rows, batch)
+    sys.stdout.flush()
+    elapsed = time.perf_counter() - start
+    sys.stdout = sys.__stdout__
+    print(elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+
+def measure(renderer, rows, batch):
+    out = subprocess.run(
+        [sys.executable, __file__, '--one', renderer, '--rows', str(rows),
+         '--batch', str(batch)],
+        stdout=subprocess.PIPE, universal_newlines=True, check=True).stdout
+    elapsed, peak_kb = out.split()
+    return float(elapsed), int(peak_kb) / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--rows', type=int, nargs='+',
+                        default=[10000, 1000000, 10000000])
+    parser.add_argument('--max_old', type=int, default=1000000,
+                        help='skip the original renderer above this many '
+                             'rows, it needs several GB at 10M')
+    parser.add_argument('--batch', type=int, default=10000)
+    parser.add_argument('--one', choices=['old', 'new'],
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.one:
+        run_one(args.one, args.rows[0], args.batch)
+        return
+
+    print('{:>10}  {:>22}  {:>22}'.format('rows', 'original', 'MetaTable'))
+    cell = '{:>8.2f} s {:>8.0f} MB'
+    for rows in args.rows:
+        old = cell.format(*measure('old', rows, args.batch)) \
+            if rows <= args.max_old else '-'
+        new = cell.format(*measure('new', rows, args.batch))
+        print('{:>10}  {:>22}  {:>22}'.format(rows, old, new))
+
+
+if __name__ == '__main__':
+    main()
@@ -13,5 +13,6 @@ setup(
     packages=find_packages(),
     scripts=['acaicli/acai'],
     include_package_data=True,
+    extras_require={'mount': ['fusepy']},
     zip_safe=True
 )
@@ -0,0 +1,54 @@
+"""JobWatcher polling against a scripted status function."""
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'acaicli'))
+
+from jobwatch import JobWatcher, UNREACHABLE  # noqa: E402
+
+
+class JobWatcherTest(unittest.TestCase):
+    def watcher(self, statuses, **kwargs):
+        """Job 1 reports ``statuses`` one poll after another."""
+        it = iter(statuses)
+
+        def status_fn(job_id):
+            s = next(it)
+            if isinstance(s, Exception):
+                raise s
+            return s
+        kwargs.setdefault('min_interval', 0.01)
+        return JobWatcher([1], status_fn=status_fn, **kwargs)
+
+    def test_until_terminal(self):
+        w = self.watcher(['QUEUED', 'RUNNING', 'RUNNING', 'FINISHED'])
+        changes = []
+        while not w.done():
+            changes += w.poll()
+        self.assertEqual(changes, [(1, 'UNKNOWN', 'QUEUED'),
+                                   (1, 'QUEUED', 'RUNNING'),
+                                   (1, 'RUNNING', 'FINISHED')])
+        self.assertEqual(w.requests, 4)
+        self.assertEqual(w.failed(), [])
+
+    def test_unreachable_after_errors(self):
+        w = self.watcher([IOError('down')] * 3, max_errors=3)
+        while not w.done():
+            w.poll()
+        self.assertEqual(w.status, {1: UNREACHABLE})
+        self.assertEqual(w.failed(), [1])
+
+    def test_timeout_caps_the_wait(self):
+        w = self.watcher(['RUNNING', 'FINISHED'], min_interval=60)
+        self.assertEqual(w.poll(), [(1, 'UNKNOWN', 'RUNNING')])
+        start = time.monotonic()
+        self.assertEqual(w.poll(timeout=0.05), [])
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertFalse(w.done())
+        self.assertEqual(w.requests, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+"""Parsing, local matching and planning of "find --query" expressions."""
+import os
+import sys
+import unittest
+import importlib.util
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'acaicli'))
+
+HAVE_SDK = importlib.util.find_spec('acaisdk') is not None
+if HAVE_SDK:
+    import query  # noqa: E402
+    from acaisdk.utils.exceptions import AcaiException  # noqa: E402
+
+MAX = sys.float_info.max
+
+
+class _Condition:
+    """Records what the planner builds as comparable tuples."""
+
+    def __init__(self, key):
+        self.c = (key, 'value', None)
+
+    def value(self, v):
+        self.c = (self.c[0], 'value', v)
+        return self
+
+    def re(self):
+        self.c = (self.c[0], 're', self.c[2])
+        return self
+
+    def range(self, lower, upper):
+        self.c = (self.c[0], 'range', (lower, upper))
+        return self
+
+    def __eq__(self, other):
+        return self.c == other
+
+    def __repr__(self):
+        return repr(self.c)
+
+
+@unittest.skipUnless(HAVE_SDK, 'acaisdk is not installed')
+class ParseTest(unittest.TestCase):
+    def matches(self, text, record):
+        return query.parse(text).matches(record)
+
+    def test_value_kinds(self):
+        self.assertTrue(self.matches('k = 7', {'k': 7}))
+        self.assertTrue(self.matches('k = 7', {'k': 7.0}))
+        self.assertFalse(self.matches('k = 7', {'k': '7'}))
+        self.assertTrue(self.matches('k = "7"', {'k': '7'}))
+        self.assertTrue(self.matches('k = .5', {'k': 0.5}))
+        self.assertTrue(self.matches('k = -1e3', {'k': -1000}))
+        self.assertTrue(self.matches('k = 007', {'k': '007'}))
+        self.assertFalse(self.matches('k = 007', {'k': 7}))
+
+    def test_bare_words_starting_with_digits(self):
+        self.assertTrue(self.matches('k = 2020-01-01', {'k': '2020-01-01'}))
+        self.assertTrue(self.matches('run = 123-abc', {'run': '123-abc'}))
+        self.assertTrue(self.matches('run = 1.5x', {'run': '1.5x'}))
+        self.assertTrue(self.matches('(k=1)', {'k': 1}))
+        self.assertTrue(self.matches('k in (1,2)', {'k': 2}))
+
+    def test_precedence(self):
+        expr = 'a = 1 or b = 2 and not c = 3'
+        self.assertTrue(self.matches(expr, {'a': 1, 'c': 3}))
+        self.assertTrue(self.matches(expr, {'b': 2}))
+        self.assertFalse(self.matches(expr, {'b': 2, 'c': 3}))
+        self.assertTrue(self.matches('A=1 AND (b=2 OR c=3)',
+                                     {'A': 1, 'c': 3}))
+
+    def test_comparisons(self):
+        self.assertTrue(self.matches('k < 0.3', {'k': 0.2}))
+        self.assertFalse(self.matches('k < 0.3', {'k': 'a'}))
+        self.assertFalse(self.matches('k < 0.3', {}))
+        self.assertTrue(self.matches('k != 1', {'k': '1'}))
+        self.assertTrue(self.matches('exists(k)', {'k': None}))
+
+    def test_regex_keeps_source_text(self):
+        self.assertTrue(self.matches('v ~ 1.50', {'v': 'x1.50'}))
+        self.assertFalse(self.matches('v ~ 1.50', {'v': '1.5'}))
+        self.assertTrue(self.matches('v =~ "^a.c$"', {'v': 'abc'}))
+
+    def test_errors(self):
+        for text in ('k =', 'k = 1 and', '(k = 1', 'k 1', 'k ~ "("',
+                     'k = 1)', '= 1'):
+            with self.subTest(text=text):
+                self.assertRaises(AcaiException, query.parse, text)
+
+
+@unittest.skipUnless(HAVE_SDK, 'acaisdk is not installed')
+class PlanTest(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch('query.Condition', _Condition)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def branches(self, text):
+        return query.plan(query.parse(text)).branches
+
+    def test_equality_and_regex(self):
+        self.assertEqual(self.branches('a = 1 and b ~ x and c in (2)'),
+                         [[('a', 'value', 1), ('b', 're', 'x'),
+                           ('c', 'value', 2)]])
+
+    def test_nothing_to_push(self):
+        self.assertEqual(self.branches('a != 1 and not b = 2'), [[]])
+        self.assertEqual(self.branches('a in (1, 2)'), [[]])
+
+    def test_two_sided_range(self):
+        self.assertEqual(self.branches('k > 1 and k <= 2 and k < 3'),
+                         [[('k', 'range', (1, 2))]])
+
+    def test_one_sided_range(self):
+        self.assertEqual(self.branches('eval_loss < 0.3'),
+                         [[('eval_loss', 'range', (-MAX, 0.3))]])
+        self.assertEqual(self.branches('epoch > 10'),
+                         [[('epoch', 'range', (10, MAX))]])
+
+    def test_inclusive_lower_bound(self):
+        [[condition]] = self.branches('k >= 1')
+        lower, upper = condition.c[2]
+        self.assertLess(lower, 1)
+        self.assertGreater(lower, 0.999999)
+        self.assertEqual(upper, MAX)
+
+    def test_string_comparison_not_pushed(self):
+        self.assertEqual(self.branches('k < abc'), [[]])
+
+    def test_or_branches(self):
+        self.assertEqual(self.branches('a = 1 or b < 2'),
+                         [[('a', 'value', 1)], [('b', 'range', (-MAX, 2))]])
+        # One branch that cannot narrow the search means a full scan
+        self.assertEqual(self.branches('a = 1 or not b = 2'), [[]])
+
+    def test_execute_filters_and_merges(self):
+        records = [{'_id': 1, 'a': 1, 'b': 5}, {'_id': 2, 'a': 2, 'b': 1},
+                   {'_id': 3, 'a': 3, 'b': 9}]
+        p = query.plan(query.parse('a = 1 or b < 2'))
+        # Every query returns everything, the local filter and the merge
+        # by id keep the answer exact
+        pages = list(p.execute(lambda *c: {'data': list(records)}, []))
+        self.assertEqual([r['_id'] for page in pages for r in page], [1, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,161 @@
+"""Sync.plan against a stand-in remote directory tree."""
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'acaicli'))
+
+from sync import Sync  # noqa: E402
+
+REMOTE_ROOT = '/r/'
+
+
+class _Remote:
+    """Files as {relative path: (version, size)}, listed like
+    File.list_dir. Directories in ``broken`` cannot be listed."""
+
+    def __init__(self):
+        self.files = {}
+        self.broken = set()
+
+    def list_dir(self, directory):
+        if directory in self.broken:
+            raise IOError('listing failed')
+        prefix = directory[len(REMOTE_ROOT):]
+        entries = {}
+        for rel, (version, _) in self.files.items():
+            if not rel.startswith(prefix):
+                continue
+            name, sep, _ = rel[len(prefix):].partition('/')
+            entries[name] = {'path': name, 'is_dir': bool(sep),
+                             'version': version}
+        return list(entries.values())
+
+    def get_file_meta(self, paths):
+        metas = {}
+        for p in paths:
+            rel, version = p[len(REMOTE_ROOT):].rsplit(':', 1)
+            metas[p] = {'_id': p, '__size__': self.files[rel][1]}
+        return metas
+
+
+class SyncPlanTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.local = os.path.join(self.dir, 'local')
+        os.makedirs(self.local)
+        self.remote = _Remote()
+        patches = [mock.patch('walk.File', self.remote),
+                   mock.patch('sync.get_file_meta',
+                              self.remote.get_file_meta)]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+        self.sync = Sync(self.local, REMOTE_ROOT,
+                         index_path=os.path.join(self.dir, 'index.sqlite'))
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.addCleanup(self.sync.close)
+
+    def write(self, rel, data=b'data'):
+        path = os.path.join(self.local, *rel.split('/'))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+
+    def synced(self, rel, data=b'data', version=1):
+        """A file both sides had at the last sync."""
+        self.write(rel, data)
+        self.remote.files[rel] = (version, len(data))
+        self.sync.remote = {rel: version}
+        self.sync._record(rel, version)
+
+    def plan(self, **kwargs):
+        p = self.sync.plan(**kwargs)
+        return {name: sorted(getattr(p, name))
+                for name in ('uploads', 'downloads', 'conflicts',
+                             'local_deletes', 'remote_deletes', 'adopted')
+                if getattr(p, name)}
+
+    def test_new_files(self):
+        self.write('only_local')
+        self.remote.files['sub/only_remote'] = (1, 4)
+        self.assertEqual(self.plan(), {'uploads': ['only_local'],
+                                       'downloads': ['sub/only_remote']})
+
+    def test_unindexed_on_both_sides(self):
+        self.write('same_size', b'abcd')
+        self.remote.files['same_size'] = (1, 4)
+        self.write('other_size', b'abc')
+        self.remote.files['other_size'] = (1, 4)
+        self.assertEqual(self.plan(), {'adopted': ['same_size'],
+                                       'conflicts': ['other_size']})
+        self.assertEqual(self.plan(prefer='remote'),
+                         {'downloads': ['other_size', 'same_size']})
+
+    def test_unchanged(self):
+        self.synced('a')
+        self.assertEqual(self.plan(), {})
+
+    def test_touched_but_same_content(self):
+        self.synced('a')
+        path = os.path.join(self.local, 'a')
+        st = os.stat(path)
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+        self.assertEqual(self.plan(), {})
+
+    def test_changed_on_one_side(self):
+        self.synced('local_edit')
+        self.synced('remote_edit')
+        self.write('local_edit', b'edited')
+        self.remote.files['remote_edit'] = (2, 4)
+        self.assertEqual(self.plan(), {'uploads': ['local_edit'],
+                                       'downloads': ['remote_edit']})
+
+    def test_changed_on_both_sides(self):
+        self.synced('a')
+        self.write('a', b'edited')
+        self.remote.files['a'] = (2, 4)
+        self.assertEqual(self.plan(), {'conflicts': ['a']})
+        self.assertEqual(self.plan(prefer='local'), {'uploads': ['a']})
+        self.assertEqual(self.plan(prefer='remote'), {'downloads': ['a']})
+
+    def test_deleted_locally(self):
+        self.synced('a')
+        os.remove(os.path.join(self.local, 'a'))
+        self.assertEqual(self.plan(), {'downloads': ['a']})
+        self.assertEqual(self.plan(delete=True), {'remote_deletes': ['a']})
+
+    def test_deleted_remotely(self):
+        self.synced('a')
+        del self.remote.files['a']
+        self.assertEqual(self.plan(), {'uploads': ['a']})
+        self.assertEqual(self.plan(delete=True), {'local_deletes': ['a']})
+
+    def test_deleted_locally_changed_remotely(self):
+        self.synced('a')
+        os.remove(os.path.join(self.local, 'a'))
+        self.remote.files['a'] = (2, 4)
+        self.assertEqual(self.plan(delete=True), {'downloads': ['a']})
+
+    def test_deleted_remotely_changed_locally(self):
+        self.synced('a')
+        self.write('a', b'edited')
+        del self.remote.files['a']
+        self.assertEqual(self.plan(delete=True), {'uploads': ['a']})
+
+    def test_listing_error_is_not_a_deletion(self):
+        self.synced('a')
+        self.synced('sub/b')
+        self.remote.broken.add(REMOTE_ROOT + 'sub/')
+        with self.assertRaises(IOError):
+            self.sync.plan(delete=True)
+        self.remote.broken.add(REMOTE_ROOT)
+        with self.assertRaises(IOError):
+            self.sync.plan(delete=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+"""Downloader against a local range-capable HTTP server."""
+import os
+import sys
+import json
+import shutil
+import hashlib
+import tempfile
+import threading
+import unittest
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'acaicli'))
+
+from transfer import Downloader, PARTIAL_SUFFIX, STATE_SUFFIX  # noqa: E402
+
+
+class _Handler(BaseHTTPRequestHandler):
+    objects = {}  # path -> bytes
+    requests = []  # (path, headers)
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        data = self.objects.get(self.path)
+        if data is None:
+            self.send_error(404)
+            return
+        self.requests.append((self.path, dict(self.headers)))
+        etag = '"{}"'.format(hashlib.md5(data).hexdigest())
+        rng = self.headers.get('Range')
+        if_range = self.headers.get('If-Range')
+        if rng and (if_range is None or if_range == etag):
+            spec = rng.split('=', 1)[1]
+            start, _, end = spec.partition('-')
+            start = int(start)
+            end = int(end) if end else len(data) - 1
+            if start >= len(data):
+                self.send_response(416)
+                self.send_header('Content-Range', 'bytes */{}'.format(
+                    len(data)))
+                self.send_header('ETag', etag)
+                self.end_headers()
+                return
+            end = min(end, len(data) - 1)
+            body = data[start:end + 1]
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes {}-{}/{}'.format(
+                start, end, len(data)))
+        else:
+            body = data
+            self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class DownloaderTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        threading.Thread(target=cls.server.serve_forever,
+                         daemon=True).start()
+        cls.base = 'http://127.0.0.1:{}'.format(cls.server.server_port)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        _Handler.objects.clear()
+        _Handler.requests.clear()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def download(self, remote, chunk_size=1024, force=True):
+        local = os.path.join(self.dir, 'out')
+        d = Downloader(url_resolver=lambda r: self.base + r, jobs=2,
+                       chunk_size=chunk_size, retries=1, force=force)
+        (_, _, error), = d.download([(remote, local)])
+        self.assertIsNone(error)
+        with open(local, 'rb') as f:
+            return f.read()
+
+    def write(self, name, data):
+        with open(os.path.join(self.dir, name), 'wb') as f:
+            f.write(data)
+
+    def test_stream(self):
+        _Handler.objects['/a'] = b'x' * 100
+        self.assertEqual(self.download('/a'), b'x' * 100)
+
+    def test_chunked(self):
+        data = os.urandom(10000)
+        _Handler.objects['/a'] = data
+        self.assertEqual(self.download('/a', chunk_size=1000), data)
+        self.assertFalse(os.path.exists(
+            os.path.join(self.dir, 'out' + STATE_SUFFIX)))
+
+    def test_stale_partial_without_state_is_discarded(self):
+        _Handler.objects['/a'] = b'new' * 30
+        self.write('out' + PARTIAL_SUFFIX, b'o' * 40)
+        self.assertEqual(self.download('/a'), b'new' * 30)
+
+    def test_stale_partial_longer_than_object(self):
+        _Handler.objects['/a'] = b'new' * 10
+        self.write('out' + PARTIAL_SUFFIX, b'o' * 100)
+        self.assertEqual(self.download('/a'), b'new' * 10)
+
+    def test_partial_of_changed_object_is_discarded(self):
+        old, new = b'old' * 30, b'new' * 30
+        _Handler.objects['/a'] = old
+        etag = '"{}"'.format(hashlib.md5(old).hexdigest())
+        self.write('out' + PARTIAL_SUFFIX, old[:40])
+        self.write('out' + STATE_SUFFIX, json.dumps(
+            {'remote': '/a', 'size': len(old), 'validator': etag,
+             'chunk_size': None, 'done': []}).encode())
+        _Handler.objects['/a'] = new
+        self.assertEqual(self.download('/a'), new)
+
+    def test_partial_of_same_object_is_resumed(self):
+        data = b'0123456789' * 10
+        _Handler.objects['/a'] = data
+        etag = '"{}"'.format(hashlib.md5(data).hexdigest())
+        self.write('out' + PARTIAL_SUFFIX, data[:40])
+        self.write('out' + STATE_SUFFIX, json.dumps(
+            {'remote': '/a', 'size': len(data), 'validator': etag,
+             'chunk_size': None, 'done': []}).encode())
+        self.assertEqual(self.download('/a'), data)
+        ranges = [h.get('Range') for _, h in _Handler.requests]
+        self.assertIn('bytes=40-', ranges)
+
+    def test_chunked_state_of_changed_object_is_discarded(self):
+        old, new = os.urandom(5000), os.urandom(5000)
+        _Handler.objects['/a'] = old
+        etag = '"{}"'.format(hashlib.md5(old).hexdigest())
+        self.write('out' + PARTIAL_SUFFIX, old[:2000] + b'\0' * 3000)
+        self.write('out' + STATE_SUFFIX, json.dumps(
+            {'remote': '/a', 'size': 5000, 'validator': etag,
+             'chunk_size': 1000, 'done': [0, 1]}).encode())
+        _Handler.objects['/a'] = new
+        self.assertEqual(self.download('/a', chunk_size=1000), new)
+
+
+if __name__ == '__main__':
+    unittest.main()